@@ -0,0 +1,261 @@
+import os
+import sys
+import json
+import uuid
+import time
+import random
+import platform
+import argparse
+import datetime
+import tempfile
+
+from pos_core import POS
+from storage import migrate, SQLITE_FILE
+from catalog import DEFAULT_PRODUCTS
+from txstore import TransactionStore
+
+# ==========================
+# BENCHMARK SUITE
+# ==========================
+# Generates synthetic transaction logs of a given size and times the paths
+# the terminals actually use, through the POS core: opening the store, loading
+# the whole history on a fresh terminal and again after one more checkout (only
+# the new receipt is read), rendering an admin history page, looking up,
+# checking out and deleting single receipts, and rewriting the whole log. Each
+# operation reports throughput and p50/p99 latency, and the results are
+# written as JSON so a later run can be compared against them.
+#
+#   python bench.py --sizes 10000 100000 --out bench.json
+#   python bench.py --sizes 10000 --baseline bench.json   (exit 1 on regression)
+#   python bench.py generate 50000 --log synthetic.json [--force]
+
+DEFAULT_SIZES = [10000, 100000]
+OPS = 200               # single-receipt operations timed per size
+TOLERANCE = 0.25        # p50 may get this much slower before it's a regression
+
+EXTRA_PRODUCTS = [("Ballpen", 12), ("Folder", 15), ("Notebook", 45), ("Lanyard Clip", 25),
+                  ("Sticker Pack", 30), ("Envelope", 5), ("Marker", 35), ("Tape", 18)]
+
+
+# ---------- synthetic data ----------
+def synthetic_records(count, days=90, seed=0):
+    # carts of 1-8 lines (mostly short), 70% cash with rounded-up tenders,
+    # timestamps in order over the last `days` days during store hours
+    rng = random.Random(seed)
+    products = [(p["name"], p["price"]) for p in DEFAULT_PRODUCTS] + EXTRA_PRODUCTS
+    first = datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=days), datetime.time(8))
+    for n in range(count):
+        day, part = divmod(n * days, max(count, 1))
+        when = first + datetime.timedelta(days=day, seconds=int(part / count * 12 * 3600))
+        items = []
+        for name, price in rng.sample(products, min(len(products), 1 + int(rng.expovariate(0.6)))):
+            qty = rng.choice([1, 1, 1, 2, 2, 3, 5, 10])
+            items.append({"name": name, "qty": qty, "price": price, "total": qty * price})
+        total = sum(i["total"] for i in items)
+        if rng.random() < 0.7:
+            method = "cash"
+            cash = total if rng.random() < 0.3 else -(-total // 100) * 100 + rng.choice([0, 0, 100, 500])
+        else:
+            method, cash = "card", total
+        yield {
+            "receipt_id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "datetime": str(when),
+            "items": items,
+            "total": total,
+            "method": method,
+            "cash": cash,
+            "change": cash - total
+        }
+
+
+def generate(path, count, days=90, seed=0):
+    store = TransactionStore(path)
+    store.rewrite(synthetic_records(count, days, seed))
+    store.close()
+
+
+# ---------- timing ----------
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def measure(op, size, fn, args_list, setup=None):
+    # setup, if given, runs untimed before each call and returns fn's args
+    samples = []
+    start = time.perf_counter()
+    for args in args_list:
+        if setup is not None:
+            args = setup(*args)
+        t = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    return {
+        "op": op,
+        "size": size,
+        "ops": len(samples),
+        "seconds": elapsed,
+        "ops_per_s": len(samples) / max(elapsed, 1e-9),
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "max_ms": max(samples) * 1000
+    }
+
+
+def render_page(pos, entries, start):
+    # what history_pager puts on screen, minus the printing
+    return [f"{t['datetime']} | {t['method'].upper()} | ₱{t['total']} | {t['receipt_id']}"
+            for t in pos.list_transactions(start, 10, entries)]
+
+
+def checkout(pos, rng):
+    cart = pos.new_cart()
+    for _ in range(rng.randint(1, 4)):
+        pos.add_item(cart, rng.choice(DEFAULT_PRODUCTS)["sku"], rng.randint(1, 3))
+    pos.checkout(cart, "card")
+
+
+def open_pos(workdir, storage):
+    return POS(storage,
+               catalog_path=os.path.join(workdir, "products.json"),
+               snapshot_path=os.path.join(workdir, "sales_snapshot.json"),
+               store_path=os.path.join(workdir, SQLITE_FILE if storage == "sqlite" else "transactions.json"),
+               stock_path=os.path.join(workdir, "stock_ledger.jsonl"),
+               zreport_path=os.path.join(workdir, "zreports.jsonl"))
+
+
+def open_store_once(workdir, storage):
+    store = open_pos(workdir, storage).store
+    len(store)
+    store.close()
+
+
+def fresh_pos(opened, workdir, storage):
+    # a terminal that has opened its store but never loaded the history
+    pos = open_pos(workdir, storage)
+    len(pos.store)
+    opened.append(pos)
+    return (pos,)
+
+
+def after_checkout(pos, rng):
+    checkout(pos, rng)
+    return (pos,)
+
+
+def bench_size(workdir, size, storage, ops, rounds, seed):
+    rng = random.Random(seed)
+    log = os.path.join(workdir, "transactions.json")
+    generate(log, size, seed=seed)
+    if storage == "sqlite":
+        migrate(log, os.path.join(workdir, SQLITE_FILE))
+
+    results = [measure("open", size, open_store_once, [(workdir, storage)] * rounds)]
+    opened = []
+    results.append(measure("history_load", size, POS.load_transactions,
+                           [(opened, workdir, storage)] * rounds, fresh_pos))
+    for p in opened:
+        p.store.close()
+
+    pos = open_pos(workdir, storage)
+    pos.load_transactions()
+    results.append(measure("history_delta", size, POS.load_transactions, [(pos, rng)] * ops, after_checkout))
+
+    entries = pos.transaction_entries()
+    ids = [e[0] for e in entries]
+    pages = [(pos, entries, rng.randrange(0, max(len(entries) - 10, 1))) for _ in range(ops)]
+    results.append(measure("history_page", size, render_page, pages))
+    results.append(measure("lookup", size, pos.get_transaction, [(rng.choice(ids),) for _ in range(ops)]))
+    results.append(measure("checkout", size, checkout, [(pos, rng)] * ops))
+    doomed = rng.sample(ids, min(ops, len(ids)))
+    results.append(measure("delete", size, pos.delete_transaction, [(r,) for r in doomed]))
+
+    data = pos.load_transactions()
+    results.append(measure("rewrite", size, pos.save_all_transactions, [(data,)] * rounds))
+    pos.store.close()
+    return results
+
+
+def run(sizes, storage="json", ops=OPS, rounds=3, seed=0, workdir=None):
+    results = []
+    for size in sizes:
+        results += bench_size(tempfile.mkdtemp(prefix=f"pos-bench-{size}-", dir=workdir),
+                              size, storage, ops, rounds, seed)
+    return {
+        "meta": {
+            "storage": storage,
+            "seed": seed,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started": str(datetime.datetime.now())
+        },
+        "results": results
+    }
+
+
+def regressions(current, baseline, tolerance=TOLERANCE):
+    before = {(r["op"], r["size"]): r for r in baseline["results"]}
+    found = []
+    for r in current["results"]:
+        old = before.get((r["op"], r["size"]))
+        if old and r["p50_ms"] > old["p50_ms"] * (1 + tolerance):
+            found.append(f"{r['op']} @ {r['size']}: p50 {old['p50_ms']:.3f}ms -> {r['p50_ms']:.3f}ms")
+    return found
+
+
+# ==========================
+# COMMAND LINE
+# ==========================
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "generate":
+        parser = argparse.ArgumentParser(description="Write a synthetic transactions.json")
+        parser.add_argument("command")
+        parser.add_argument("count", type=int)
+        parser.add_argument("--log", required=True, help="file to write (replaced entirely)")
+        parser.add_argument("--days", type=int, default=90)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--force", action="store_true", help="overwrite a log that already has receipts")
+        args = parser.parse_args(argv)
+        if os.path.exists(args.log) and os.path.getsize(args.log) and not args.force:
+            print(f"{args.log} already has receipts; pass --force to replace them with synthetic data")
+            return 1
+        generate(args.log, args.count, args.days, args.seed)
+        print(f"Wrote {args.count} receipts to {args.log}")
+        return 0
+
+    parser = argparse.ArgumentParser(description="Benchmark the POS checkout and history paths")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--storage", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--ops", type=int, default=OPS)
+    parser.add_argument("--rounds", type=int, default=3, help="repeats of the whole-log operations")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", default=None, help="where to put the generated logs (default: temp)")
+    parser.add_argument("--out", default=None, help="write the results here as JSON")
+    parser.add_argument("--baseline", default=None, help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    report = run(args.sizes, args.storage, args.ops, args.rounds, args.seed, args.dir)
+    print(f"{'op':<14}{'size':>9}{'ops/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for r in report["results"]:
+        print(f"{r['op']:<14}{r['size']:>9}{r['ops_per_s']:>12.1f}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=1)
+        print(f"Wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print("REGRESSION: " + line)
+        if found:
+            return 1
+        print("OK: no regressions against " + args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,356 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import struct
+import argparse
+import datetime
+import tempfile
+
+from txstore import TransactionStore, FileLock, LOCK_SUFFIX, encode
+
+# ==========================
+# BINARY RECEIPT LOG
+# ==========================
+# A compact alternative to the JSON lines: after an 8-byte magic the file is a
+# sequence of frames, each starting with a one-byte tag.
+#
+#   S  <H length><utf-8 bytes>                 next string-table entry
+#   R  <16s uuid><q epoch us><i total><i cash><i change><I method><H items>
+#      then per item <I name><i qty><i price><i total><I sku><H version>
+#   D  <16s uuid>                              tombstone
+#
+# Product names, SKUs and payment methods are written once, the first time
+# they appear, and referenced by their position in the string table after
+# that; positions are 32-bit, so a catalog of any realistic size fits. Items
+# keep the name and price they were sold under next to the catalog SKU and
+# version (NO_SKU and 0 for lines from before SKUs were recorded). Datetimes
+# are stored as microseconds since 1970-01-01 in local time and come back as
+# the same str(datetime) the terminals wrote.
+#
+#   python binlog.py convert transactions.json transactions.bin
+#   python binlog.py export transactions.bin transactions.json
+#   python binlog.py bench transactions.json     size and parse time vs JSON
+
+MAGIC = b"POSBIN3\n"
+EPOCH = datetime.datetime(1970, 1, 1)
+
+STRING = struct.Struct("<cH")
+RECEIPT = struct.Struct("<c16sqiiiIH")
+ITEM = struct.Struct("<IiiiIH")
+NO_SKU = 0xFFFFFFFF     # never a string position: the table can't get that big
+TOMBSTONE = struct.Struct("<c16s")
+
+
+def to_micros(text):
+    delta = datetime.datetime.fromisoformat(text) - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+# dates and times of day already formatted, since a log spans few days and a
+# day has only 86400 distinct seconds
+DATES = {}
+CLOCK = {}
+
+
+def from_micros(us):
+    # same text as str(datetime)
+    seconds, micro = divmod(us, 1000000)
+    day, second = divmod(seconds, 86400)
+    date = DATES.get(day)
+    if date is None:
+        date = DATES[day] = str((EPOCH + datetime.timedelta(days=day)).date()) + " "
+    hms = CLOCK.get(second)
+    if hms is None:
+        hms = CLOCK[second] = f"{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}"
+    if micro:
+        return f"{date}{hms}.{micro:06d}"
+    return date + hms
+
+
+def uuid_text(raw):
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+class BinaryLog:
+    def __init__(self, path):
+        self.path = path
+        self.strings = []       # string table, in file order
+        self.ids = {}           # string -> position in the table
+        self.size = 0           # bytes already scanned
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(MAGIC)
+        self.scan_strings()
+
+    # ---------- string table ----------
+    def scan_strings(self):
+        # walk the frames once to learn the table, skipping receipt bodies
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f"{self.path} is not a binary receipt log")
+        pos = len(MAGIC)
+        end = len(data)
+        while pos < end:
+            tag = data[pos:pos + 1]
+            if tag == b"S":
+                if pos + STRING.size > end:
+                    break
+                length = STRING.unpack_from(data, pos)[1]
+                if pos + STRING.size + length > end:
+                    break
+                self.add_string(data[pos + STRING.size:pos + STRING.size + length].decode("utf-8"))
+                pos += STRING.size + length
+            elif tag == b"R":
+                if pos + RECEIPT.size > end:
+                    break
+                count = RECEIPT.unpack_from(data, pos)[7]
+                if pos + RECEIPT.size + count * ITEM.size > end:
+                    break
+                pos += RECEIPT.size + count * ITEM.size
+            elif tag == b"D":
+                if pos + TOMBSTONE.size > end:
+                    break
+                pos += TOMBSTONE.size
+            else:
+                raise ValueError(f"{self.path}: bad frame at byte {pos}")
+        self.size = pos
+        if pos < end:
+            # torn frame from an interrupted write
+            with open(self.path, "rb+") as f:
+                f.truncate(pos)
+
+    def add_string(self, text):
+        self.ids[text] = len(self.strings)
+        self.strings.append(text)
+
+    def string_id(self, text, out):
+        sid = self.ids.get(text)
+        if sid is None:
+            data = text.encode("utf-8")
+            out.append(STRING.pack(b"S", len(data)) + data)
+            sid = len(self.strings)
+            self.add_string(text)
+        return sid
+
+    # ---------- encoding ----------
+    def encode(self, record):
+        out = []
+        items = [ITEM.pack(self.string_id(i["name"], out), i["qty"], i["price"], i["total"],
+                           self.string_id(i["sku"], out) if "sku" in i else NO_SKU, i.get("version", 0))
+                 for i in record["items"]]
+        method = self.string_id(record["method"], out)
+        out.append(RECEIPT.pack(b"R", uuid.UUID(record["receipt_id"]).bytes, to_micros(record["datetime"]),
+                                record["total"], record["cash"], record["change"], method, len(items)))
+        out.extend(items)
+        return b"".join(out)
+
+    def decode(self, data):
+        # yields ("R", record) and ("D", receipt_id) in file order
+        strings = []
+        pos = len(MAGIC)
+        unpack_receipt = RECEIPT.unpack_from
+        iter_items = ITEM.iter_unpack
+        end = len(data)
+        while pos < end:
+            tag = data[pos]
+            if tag == 82:       # R
+                _, raw_id, us, total, cash, change, method, count = unpack_receipt(data, pos)
+                pos += RECEIPT.size
+                stop = pos + count * ITEM.size
+                items = []
+                for n, q, p, t, sku, version in iter_items(data[pos:stop]):
+                    item = {"name": strings[n], "qty": q, "price": p, "total": t}
+                    if sku != NO_SKU:
+                        item["sku"] = strings[sku]
+                        item["version"] = version
+                    items.append(item)
+                pos = stop
+                yield "R", {
+                    "receipt_id": uuid_text(raw_id),
+                    "datetime": from_micros(us),
+                    "items": items,
+                    "total": total,
+                    "method": strings[method],
+                    "cash": cash,
+                    "change": change
+                }
+            elif tag == 83:     # S
+                length = STRING.unpack_from(data, pos)[1]
+                pos += STRING.size
+                strings.append(data[pos:pos + length].decode("utf-8"))
+                pos += length
+            else:               # D
+                yield "D", uuid_text(TOMBSTONE.unpack_from(data, pos)[1])
+                pos += TOMBSTONE.size
+
+    # ---------- reads ----------
+    def read_all(self):
+        with open(self.path, "rb") as f:
+            return f.read(self.size) if self.size else f.read()
+
+    def records(self):
+        data = self.read_all()
+        live = {}
+        for kind, value in self.decode(data):
+            if kind == "R":
+                live[value["receipt_id"]] = value
+            else:
+                live.pop(value, None)
+        return list(live.values())
+
+    def entries(self):
+        # [receipt_id, frame offset, datetime, method, total] per live receipt,
+        # as the JSON store indexes them, without decoding any items
+        data = self.read_all()
+        strings = []
+        live = {}
+        pos = len(MAGIC)
+        end = len(data)
+        while pos < end:
+            tag = data[pos]
+            if tag == 82:
+                _, raw_id, us, total, _, _, method, count = RECEIPT.unpack_from(data, pos)
+                rid = uuid_text(raw_id)
+                live[rid] = [rid, pos, from_micros(us), strings[method], total]
+                pos += RECEIPT.size + count * ITEM.size
+            elif tag == 83:
+                length = STRING.unpack_from(data, pos)[1]
+                strings.append(data[pos + STRING.size:pos + STRING.size + length].decode("utf-8"))
+                pos += STRING.size + length
+            else:
+                live.pop(uuid_text(TOMBSTONE.unpack_from(data, pos)[1]), None)
+                pos += TOMBSTONE.size
+        return list(live.values())
+
+    # ---------- writes ----------
+    def write(self, data, sync=True):
+        with open(self.path, "ab") as f:
+            f.write(data)
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+        self.size += len(data)
+
+    def append(self, record):
+        self.write(self.encode(record))
+
+    def delete(self, receipt_id):
+        self.write(TOMBSTONE.pack(b"D", uuid.UUID(receipt_id).bytes))
+
+    def rewrite(self, records):
+        tmp = self.path + ".tmp"
+        self.strings, self.ids = [], {}
+        size = len(MAGIC)
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            for rec in records:
+                data = self.encode(rec)
+                f.write(data)
+                size += len(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.size = size
+
+
+# ==========================
+# CONVERSION
+# ==========================
+def convert(json_path, bin_path):
+    if os.path.exists(bin_path):
+        os.remove(bin_path)
+    store = TransactionStore(json_path)
+    records = store.records()
+    store.close()
+    log = BinaryLog(bin_path)
+    log.rewrite(records)
+    return len(log.records())
+
+
+def export(bin_path, json_path):
+    records = BinaryLog(bin_path).records()
+    tmp = json_path + ".tmp"
+    with open(tmp, "wb") as f:
+        for rec in records:
+            f.write(encode(rec))
+    os.replace(tmp, json_path)
+    return len(records)
+
+
+def benchmark(json_path, bin_path=None):
+    # works on a copy, so the live log and its index are never touched
+    workdir = tempfile.mkdtemp(prefix="pos-binlog-")
+    try:
+        copy = os.path.join(workdir, os.path.basename(json_path))
+        with FileLock(json_path + LOCK_SUFFIX):
+            shutil.copyfile(json_path, copy)
+        return measure(copy, bin_path or copy + ".bin")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def measure(json_path, bin_path):
+    start = time.perf_counter()
+    TransactionStore(json_path).close()     # no .idx yet: indexed from scratch
+    json_index = time.perf_counter() - start
+    convert(json_path, bin_path)
+    start = time.perf_counter()
+    with open(json_path, "rb") as f:
+        [json.loads(line) for line in f if line.strip()]
+    json_time = time.perf_counter() - start
+    start = time.perf_counter()
+    from_bin = BinaryLog(bin_path).records()
+    bin_time = time.perf_counter() - start
+    store = TransactionStore(json_path)
+    expected = [r["receipt_id"] for r in store.records()]
+    store.close()
+    if [r["receipt_id"] for r in from_bin] != expected:
+        raise RuntimeError("binary log does not match the JSON log")
+    start = time.perf_counter()
+    BinaryLog(bin_path).entries()
+    bin_index = time.perf_counter() - start
+    json_size, bin_size = os.path.getsize(json_path), os.path.getsize(bin_path)
+    return {
+        "receipts": len(from_bin),
+        "json_bytes": json_size,
+        "binary_bytes": bin_size,
+        "size_ratio": json_size / max(bin_size, 1),
+        "json_parse_s": json_time,
+        "binary_parse_s": bin_time,
+        "parse_speedup": json_time / max(bin_time, 1e-9),
+        "json_index_s": json_index,
+        "binary_index_s": bin_index,
+        "index_speedup": json_index / max(bin_index, 1e-9),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Binary receipt log tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    c = sub.add_parser("convert", help="JSON lines -> binary")
+    c.add_argument("source", nargs="?", default="transactions.json")
+    c.add_argument("target", nargs="?", default="transactions.bin")
+    e = sub.add_parser("export", help="binary -> JSON lines")
+    e.add_argument("source", nargs="?", default="transactions.bin")
+    e.add_argument("target", nargs="?", default="transactions_export.json")
+    b = sub.add_parser("bench", help="compare size and parse time")
+    b.add_argument("source", nargs="?", default="transactions.json")
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        print(f"Wrote {convert(args.source, args.target)} receipts to {args.target}")
+    elif args.command == "export":
+        print(f"Wrote {export(args.source, args.target)} receipts to {args.target}")
+    else:
+        for key, value in benchmark(args.source).items():
+            print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
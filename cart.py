@@ -0,0 +1,86 @@
+from itertools import islice
+
+# ==========================
+# CART
+# ==========================
+# Lines are keyed by product SKU, so adding the same product again merges
+# into its line, and changing or removing a line is a dict operation. The
+# running total is only ever changed together with a line, so it can't
+# drift from the items.
+
+
+class CartLine:
+    __slots__ = ("sku", "version", "name", "qty", "price", "total")
+
+    def __init__(self, sku, name, price, version=None):
+        self.sku = sku
+        self.version = version  # catalog version the name and price come from
+        self.name = name
+        self.price = price
+        self.qty = 0
+        self.total = 0
+
+    def as_dict(self):
+        line = {"name": self.name, "qty": self.qty, "price": self.price, "total": self.total}
+        if self.version is not None:
+            line["sku"] = self.sku
+            line["version"] = self.version
+        return line
+
+
+class Cart:
+    __slots__ = ("lines", "total")
+
+    def __init__(self):
+        self.lines = {}     # sku -> CartLine, in the order first added
+        self.total = 0
+
+    def add(self, product, qty):
+        sku = product.get("sku", product["name"])
+        line = self.lines.get(sku)
+        if line is None:
+            line = self.lines[sku] = CartLine(sku, product["name"], product["price"], product.get("version"))
+        cost = qty * line.price
+        line.qty += qty
+        line.total += cost
+        self.total += cost
+        return line
+
+    def set_qty(self, sku, qty):
+        line = self.lines[sku]
+        if qty <= 0:
+            self.remove(sku)
+            return
+        self.total += (qty - line.qty) * line.price
+        line.qty = qty
+        line.total = qty * line.price
+
+    def remove(self, sku):
+        line = self.lines.pop(sku)
+        self.total -= line.total
+
+    def void(self):
+        self.lines.clear()
+        self.total = 0
+
+    def items(self):
+        return [line.as_dict() for line in self.lines.values()]
+
+    def tail(self, count):
+        # the last `count` lines, without walking a long cart
+        if len(self.lines) <= count:
+            return list(self.lines.values())
+        keys = list(islice(reversed(self.lines), count))
+        return [self.lines[k] for k in reversed(keys)]
+
+    def __getitem__(self, sku):
+        return self.lines[sku]
+
+    def __contains__(self, sku):
+        return sku in self.lines
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        return iter(self.lines.values())
@@ -0,0 +1,191 @@
+import os
+import sys
+import csv
+import json
+import argparse
+import datetime
+import itertools
+from bisect import bisect_left, bisect_right
+
+# ==========================
+# PRODUCT CATALOG
+# ==========================
+# Products live in products.json, keyed by SKU. Lookups by SKU or barcode are
+# plain dict hits, and a sorted (lowercase name, sku) list answers type-ahead
+# name searches with a bisect. Edits are written straight back to disk, and
+# every terminal reloads the file when it sees it change.
+#
+# A product's SKU is its ID for good; its name and price are versioned. Each
+# product carries "history": [[since, name, price], ...] (since "" for the
+# version it had before history was kept) and "version", the number of its
+# current entry. Cart lines record sku + version, so reports can group by
+# SKU and any receipt's product can be looked up as it was when sold.
+#
+#   python catalog.py import products.csv   (columns: sku,barcode,name,price)
+
+CATALOG_FILE = "products.json"
+
+# the old hardcoded list; SKUs match the numbers cashiers already know
+DEFAULT_PRODUCTS = [
+    {"sku": "1", "barcode": "", "name": "ID Lace", "price": 75},
+    {"sku": "2", "barcode": "", "name": "Logo", "price": 50},
+    {"sku": "3", "barcode": "", "name": "Cartolina", "price": 20},
+    {"sku": "4", "barcode": "", "name": "Bond Paper", "price": 1}
+]
+
+
+class Catalog:
+    def __init__(self, path=CATALOG_FILE):
+        self.path = path
+        self.products = {}      # sku -> product
+        self.by_barcode = {}    # barcode -> product
+        self.names = []         # sorted (lowercase name, sku)
+        self.past_names = {}    # any name a product has had -> sku
+        self.stamp = None       # (mtime, size) of the file we loaded
+        if not os.path.exists(path):
+            self.products = {p["sku"]: dict(p) for p in DEFAULT_PRODUCTS}
+            self.save()
+        self.load()
+
+    # ---------- persistence ----------
+    def load(self):
+        with open(self.path, "r") as f:
+            self.products = {p["sku"]: p for p in json.load(f)}
+        for p in self.products.values():
+            if "history" not in p:
+                p["history"] = [["", p["name"], p["price"]]]
+                p["version"] = 1
+        self.stamp = self.file_stamp()
+        self.reindex()
+
+    def save(self):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(list(self.products.values()), f, indent=1)
+        os.replace(tmp, self.path)
+        self.stamp = self.file_stamp()
+
+    def file_stamp(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def refresh(self):
+        # pick up edits saved by another terminal
+        if self.file_stamp() != self.stamp:
+            self.load()
+
+    def reindex(self):
+        self.by_barcode = {p["barcode"]: p for p in self.products.values() if p.get("barcode")}
+        self.names = sorted((p["name"].lower(), sku) for sku, p in self.products.items())
+        # every name a product was ever sold under, for receipts without a SKU
+        self.past_names = {}
+        for sku, p in self.products.items():
+            for _, name, _ in p["history"]:
+                self.past_names.setdefault(name, sku)
+
+    # ---------- lookups ----------
+    def lookup(self, code):
+        self.refresh()
+        code = code.strip()
+        return self.products.get(code) or self.by_barcode.get(code)
+
+    def search(self, prefix, limit=10):
+        self.refresh()
+        prefix = prefix.strip().lower()
+        found = []
+        for i in range(bisect_left(self.names, (prefix,)), len(self.names)):
+            name, sku = self.names[i]
+            if not name.startswith(prefix) or len(found) >= limit:
+                break
+            found.append(self.products[sku])
+        return found
+
+    def first(self, count):
+        self.refresh()
+        return list(itertools.islice(self.products.values(), count))
+
+    def __len__(self):
+        return len(self.products)
+
+    # ---------- history ----------
+    def version(self, sku, version):
+        # the product as it was at `version` (1 = oldest known)
+        self.refresh()
+        p = self.products.get(sku)
+        if p is None or not 1 <= version <= len(p["history"]):
+            return None
+        since, name, price = p["history"][version - 1]
+        return {"sku": sku, "version": version, "since": since, "name": name, "price": price}
+
+    def at(self, sku, when):
+        # the version in effect at datetime string `when`
+        self.refresh()
+        p = self.products.get(sku)
+        if p is None:
+            return None
+        n = bisect_right(p["history"], when, key=lambda h: h[0])
+        return self.version(sku, max(n, 1))
+
+    def resolve(self, item):
+        # the SKU a receipt line belongs to: its own, or by the name it was sold under
+        return item.get("sku") or self.past_names.get(item["name"])
+
+    def name_of(self, sku):
+        p = self.products.get(sku)
+        return p["name"] if p else sku
+
+    # ---------- edits ----------
+    def revise(self, p, name, price, when):
+        if [name, price] != [p["name"], p["price"]]:
+            p["history"].append([when, name, price])
+            p["version"] = len(p["history"])
+            p["name"], p["price"] = name, price
+
+    def update(self, sku, **changes):
+        self.refresh()
+        p = self.products[sku]
+        name = changes.pop("name", p["name"])
+        price = changes.pop("price", p["price"])
+        p.update(changes)
+        self.revise(p, name, price, str(datetime.datetime.now()))
+        self.reindex()
+        self.save()
+
+    def add_many(self, products):
+        self.refresh()
+        now = str(datetime.datetime.now())
+        for new in products:
+            p = self.products.get(new["sku"])
+            if p is None:
+                p = self.products[new["sku"]] = dict(new, history=[[now, new["name"], new["price"]]], version=1)
+            else:
+                p["barcode"] = new.get("barcode", p.get("barcode", ""))
+                self.revise(p, new["name"], new["price"], now)
+        self.reindex()
+        self.save()
+
+
+def import_csv(catalog, path):
+    with open(path, "r", newline="") as f:
+        rows = [{"sku": r["sku"].strip(), "barcode": r.get("barcode", "").strip(),
+                 "name": r["name"].strip(), "price": int(r["price"])}
+                for r in csv.DictReader(f)]
+    catalog.add_many(rows)
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Product catalog tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="add or replace products from a CSV file")
+    imp.add_argument("csv")
+    imp.add_argument("--catalog", default=CATALOG_FILE)
+    args = parser.parse_args(argv)
+
+    count = import_csv(Catalog(args.catalog), args.csv)
+    print(f"Imported {count} products into {args.catalog}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+import os
+import sys
+import csv
+import time
+import argparse
+
+from txstore import TransactionStore
+
+try:
+    import numpy as np
+except ImportError:     # export still works (as CSV); report and bench need numpy
+    np = None
+
+# ==========================
+# COLUMNAR EXPORT
+# ==========================
+# Flattens transactions.json into a receipts table and a line-items table,
+# one array per column. Month-end aggregations then run as numpy bincounts
+# over those arrays instead of json.loads + nested loops per receipt.
+#
+#   python columnar.py export          -> transactions_columns.npz (or .csv)
+#   python columnar.py report          -> totals by product, day and method
+#                                         (exports first if the .npz is missing
+#                                         or the log changed since; --refresh
+#                                         always does)
+#   python columnar.py bench           -> columnar vs pure-Python timings
+
+EXPORT_BASE = "transactions_columns"
+METHODS = ["cash", "card"]
+
+RECEIPT_COLUMNS = ["receipt_id", "date", "hour", "total", "method", "cash", "change"]
+ITEM_COLUMNS = ["item_receipt", "item_product", "item_qty", "item_price", "item_total"]
+DTYPES = {"receipt_id": "U36", "names": "U", "methods": "U"}     # everything else is int64
+
+
+def to_columns(records):
+    cols = {name: [] for name in RECEIPT_COLUMNS + ITEM_COLUMNS}
+    names = {}
+    methods = {m: i for i, m in enumerate(METHODS)}
+    for row, t in enumerate(records):
+        dt = t["datetime"]
+        cols["receipt_id"].append(t["receipt_id"])
+        cols["date"].append(int(dt[0:4] + dt[5:7] + dt[8:10]))
+        cols["hour"].append(int(dt[11:13] or 0))
+        cols["total"].append(t["total"])
+        cols["method"].append(methods.setdefault(t["method"], len(methods)))
+        cols["cash"].append(t["cash"])
+        cols["change"].append(t["change"])
+        for item in t["items"]:
+            cols["item_receipt"].append(row)
+            cols["item_product"].append(names.setdefault(item["name"], len(names)))
+            cols["item_qty"].append(item["qty"])
+            cols["item_price"].append(item["price"])
+            cols["item_total"].append(item["total"])
+    cols["names"] = list(names)
+    cols["methods"] = list(methods)
+    return cols
+
+
+# ---------- save / load ----------
+def log_stamp(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def export(store, base=EXPORT_BASE):
+    # stamped before reading, so a receipt appended meanwhile makes it stale
+    stamp = log_stamp(store.path)
+    cols = to_columns(store.records())
+    if np is not None:
+        arrays = {k: np.asarray(v, dtype=DTYPES.get(k, "int64")) for k, v in cols.items()}
+        arrays["log_stamp"] = np.asarray(stamp, dtype="int64")
+        np.savez_compressed(base + ".npz", **arrays)
+        return [base + ".npz"]
+
+    files = [base + "_receipts.csv", base + "_items.csv", base + "_names.csv"]
+    with open(files[0], "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(RECEIPT_COLUMNS)
+        w.writerows(zip(*(cols[c] for c in RECEIPT_COLUMNS)))
+    with open(files[1], "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(ITEM_COLUMNS)
+        w.writerows(zip(*(cols[c] for c in ITEM_COLUMNS)))
+    with open(files[2], "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["kind", "code", "value"])
+        w.writerows(("product", i, n) for i, n in enumerate(cols["names"]))
+        w.writerows(("method", i, m) for i, m in enumerate(cols["methods"]))
+    return files
+
+
+def up_to_date(path, base=EXPORT_BASE):
+    # the .npz was exported from the log as it is now
+    if not os.path.exists(base + ".npz"):
+        return False
+    with np.load(base + ".npz") as data:
+        return "log_stamp" in data.files and data["log_stamp"].tolist() == log_stamp(path)
+
+
+def load(base=EXPORT_BASE):
+    with np.load(base + ".npz") as data:
+        cols = {k: data[k] for k in data.files}
+    cols["names"] = cols["names"].tolist()
+    cols["methods"] = cols["methods"].tolist()
+    return cols
+
+
+# ---------- batched aggregations ----------
+def group_sum(keys, values, size):
+    return np.bincount(keys, weights=values, minlength=size).astype(np.int64)
+
+
+def sum_by_product(cols):
+    n = len(cols["names"])
+    qty = group_sum(cols["item_product"], cols["item_qty"], n)
+    revenue = group_sum(cols["item_product"], cols["item_total"], n)
+    return {cols["names"][i]: (int(qty[i]), int(revenue[i])) for i in range(n)}
+
+
+def sum_by_day(cols):
+    days, inverse = np.unique(cols["date"], return_inverse=True)
+    revenue = group_sum(inverse, cols["total"], len(days))
+    return {int(d): int(r) for d, r in zip(days, revenue)}
+
+
+def sum_by_method(cols):
+    n = len(cols["methods"])
+    counts = np.bincount(cols["method"], minlength=n)
+    totals = group_sum(cols["method"], cols["total"], n)
+    return {cols["methods"][i]: (int(counts[i]), int(totals[i])) for i in range(n) if counts[i]}
+
+
+# ---------- pure-Python reference ----------
+def loop_aggregates(records):
+    by_product, by_day, by_method = {}, {}, {}
+    for t in records:
+        dt = t["datetime"]
+        day = int(dt[0:4] + dt[5:7] + dt[8:10])
+        by_day[day] = by_day.get(day, 0) + t["total"]
+        count, total = by_method.get(t["method"], (0, 0))
+        by_method[t["method"]] = (count + 1, total + t["total"])
+        for item in t["items"]:
+            qty, revenue = by_product.get(item["name"], (0, 0))
+            by_product[item["name"]] = (qty + item["qty"], revenue + item["total"])
+    return by_product, by_day, by_method
+
+
+def columnar_aggregates(cols):
+    return sum_by_product(cols), sum_by_day(cols), sum_by_method(cols)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def benchmark(store, base=EXPORT_BASE, rounds=5):
+    records, parse = timed(lambda: list(store.records()))
+    loop_result, loop_agg = timed(loop_aggregates, records)
+    _, export_time = timed(export, store, base)
+    cols, load_time = timed(load, base)
+    col_result, col_agg = timed(columnar_aggregates, cols)
+    if tuple(loop_result) != tuple(col_result):
+        raise RuntimeError("columnar and loop aggregates disagree")
+
+    loop_best = min(timed(loop_aggregates, records)[1] for _ in range(rounds))
+    col_best = min(timed(columnar_aggregates, cols)[1] for _ in range(rounds))
+    return {
+        "receipts": len(records),
+        "line_items": len(cols["item_total"]),
+        "loop_parse_s": parse,
+        "loop_aggregate_s": min(loop_agg, loop_best),
+        "export_s": export_time,
+        "columnar_load_s": load_time,
+        "columnar_aggregate_s": min(col_agg, col_best),
+        "speedup_aggregate": min(loop_agg, loop_best) / max(min(col_agg, col_best), 1e-9),
+        "speedup_load_and_aggregate": (parse + loop_best) / max(load_time + col_best, 1e-9),
+    }
+
+
+# ==========================
+# COMMAND LINE
+# ==========================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Columnar export and analytics of transactions.json")
+    parser.add_argument("command", choices=["export", "report", "bench"])
+    parser.add_argument("--log", default="transactions.json")
+    parser.add_argument("--out", default=EXPORT_BASE)
+    parser.add_argument("--refresh", action="store_true", help="report: export again even if the .npz is current")
+    args = parser.parse_args(argv)
+
+    store = TransactionStore(args.log)
+    if args.command == "export":
+        for name in export(store, args.out):
+            print(f"Wrote {name}")
+        return 0
+
+    if np is None:
+        print("numpy is not installed; report and bench need it (export writes CSV without it).")
+        return 1
+
+    if args.command == "report":
+        if args.refresh or not up_to_date(args.log, args.out):
+            export(store, args.out)
+        by_product, by_day, by_method = columnar_aggregates(load(args.out))
+        print("By product:")
+        for name, (qty, revenue) in sorted(by_product.items(), key=lambda kv: -kv[1][1]):
+            print(f"  {name} x{qty} = ₱{revenue}")
+        print("By day:")
+        for day, revenue in sorted(by_day.items()):
+            print(f"  {day}  ₱{revenue}")
+        print("By method:")
+        for method, (count, total) in by_method.items():
+            print(f"  {method}: {count} receipts, ₱{total}")
+    else:
+        for key, value in benchmark(store, args.out).items():
+            print(f"{key}: {value:.4f}" if isinstance(value, float) else f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+import os
+import sys
+import json
+import atexit
+import argparse
+import datetime
+import threading
+
+import metrics
+from txstore import FileLock, encode, file_identity
+
+# ==========================
+# STOCK LEDGER
+# ==========================
+# Stock is an append-only ledger of movements in stock_ledger.jsonl, one JSON
+# line each:
+#
+#   {"time": "...", "sku": "2", "delta": -3, "reason": "sale", "ref": <receipt_id>}
+#
+# with reason "sale", "receive" or "count" (a physical recount, written as
+# the difference to what the ledger said). Current levels are kept in memory
+# and saved next to the ledger (stock_ledger.jsonl.snapshot.json) with the
+# ledger size they cover, so opening the ledger only folds in the movements
+# after the snapshot, and asking for a product's stock is a dict lookup.
+# Lines other terminals append are picked up by size, like the transaction
+# log.
+#
+# A checkout's movements go out as one write + fsync under the ledger's lock,
+# right after its receipt is on disk. A crash in between loses the movements
+# but never the receipt; `rebuild --receipts` books every receipt it has no
+# sale movements for, for the products that were already tracked when it was
+# rung up. It looks at the receipts after the store checkpoint the previous
+# `rebuild --receipts` got through (kept in the snapshot), or, when the log
+# was rewritten since, at those from REBUILD_OVERLAP seconds before the
+# newest receipt it saw then; the first time, at every receipt since stock
+# was first received or counted.
+#
+# Only SKUs that were ever received or counted are tracked; a product is low
+# on stock at or below its "reorder_at" (POS_LOW_STOCK if it has none).
+#
+#   python inventory.py status
+#   python inventory.py receive SKU QTY | count SKU QTY
+#   python inventory.py rebuild [--receipts]
+
+LEDGER_FILE = "stock_ledger.jsonl"
+SNAPSHOT_SUFFIX = ".snapshot.json"
+LOCK_SUFFIX = ".lock"
+SNAPSHOT_EVERY = 200        # save levels after this many movements (and on exit)
+REBUILD_OVERLAP = 60        # seconds re-checked when the checked checkpoint is stale
+LOW_STOCK = int(os.environ.get("POS_LOW_STOCK", "5"))
+
+
+class StockLedger:
+    def __init__(self, path=LEDGER_FILE):
+        self.path = path
+        self.snapshot_path = path + SNAPSHOT_SUFFIX
+        self.lock = threading.RLock()
+        self.file_lock = FileLock(path + LOCK_SUFFIX)
+        self.levels = {}        # sku -> units on hand
+        self.identity = None
+        self.size = 0           # bytes of the ledger folded into levels
+        self.pending = 0
+        self.checked = None     # {"checkpoint": .., "through": ..} of the last rebuild --receipts
+        if not os.path.exists(path):
+            open(path, "a").close()
+        self.identity = file_identity(os.stat(path))
+        if not self.load_snapshot():
+            self.levels, self.size = {}, 0
+        self.refresh()
+        atexit.register(self.save_snapshot)
+
+    # ---------- persistence ----------
+    def load_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path, "r") as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            return False
+        self.checked = snap.get("checked")     # about the store, so good either way
+        if snap.get("identity") != self.identity or snap.get("size", 0) > os.path.getsize(self.path):
+            return False
+        self.levels = snap["levels"]
+        self.size = snap["size"]
+        return True
+
+    def save_snapshot(self):
+        with self.lock:
+            snap = {"identity": self.identity, "size": self.size, "levels": self.levels, "checked": self.checked}
+            tmp = f"{self.snapshot_path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                f.write(json.dumps(snap))
+            os.replace(tmp, self.snapshot_path)
+            self.pending = 0
+
+    def refresh(self):
+        # fold in movements appended since we last looked, by us or others
+        with self.lock:
+            st = os.stat(self.path)
+            if file_identity(st) != self.identity or st.st_size < self.size:
+                # replaced behind our back: start over from the new file
+                self.identity = file_identity(st)
+                self.levels, self.size = {}, 0
+            if st.st_size <= self.size:
+                return False
+            with open(self.path, "rb") as f:
+                f.seek(self.size)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break       # torn line from a terminal that crashed
+                    if line.strip():
+                        self.apply(json.loads(line))
+                    self.size += len(line)
+            return True
+
+    def apply(self, move):
+        self.levels[move["sku"]] = self.levels.get(move["sku"], 0) + move["delta"]
+        self.pending += 1
+
+    # ---------- reads ----------
+    def level(self, sku):
+        # units on hand, or None for an untracked product
+        with self.lock:
+            self.refresh()
+            return self.levels.get(sku)
+
+    def snapshot(self):
+        with self.lock:
+            self.refresh()
+            return dict(self.levels)
+
+    # ---------- writes ----------
+    def write(self, moves):
+        if not moves:
+            return
+        with self.lock, self.file_lock:
+            self.refresh()
+            data = b"".join(encode(m) for m in moves)
+            with metrics.timer("stock.write") as t, open(self.path, "rb+") as f:
+                # anything past what refresh() folded in is a torn line
+                f.truncate(self.size)
+                f.seek(self.size)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+                t.bytes = len(data)
+            for m in moves:
+                self.apply(m)
+            self.size += len(data)
+            if self.pending >= SNAPSHOT_EVERY:
+                self.save_snapshot()
+
+    def move(self, sku, delta, reason, ref=None, when=None):
+        return {"time": when or str(datetime.datetime.now()), "sku": sku, "delta": delta,
+                "reason": reason, "ref": ref}
+
+    def sell(self, receipt):
+        # one movement per tracked line of the receipt, written together
+        with self.lock, self.file_lock:
+            self.refresh()
+            moves = [self.move(i["sku"], -i["qty"], "sale", receipt["receipt_id"], receipt["datetime"])
+                     for i in receipt["items"] if "sku" in i and i["sku"] in self.levels]
+            self.write(moves)
+        return moves
+
+    def receive(self, sku, qty, ref=None):
+        self.write([self.move(sku, qty, "receive", ref)])
+        return self.levels[sku]
+
+    def count(self, sku, qty, ref=None):
+        with self.lock, self.file_lock:
+            self.refresh()
+            self.write([self.move(sku, qty - self.levels.get(sku, 0), "count", ref)])
+        return qty
+
+    # ---------- recovery ----------
+    def rebuild(self, store=None):
+        # levels from the ledger alone, ignoring the snapshot; with a store,
+        # also book sales for receipts whose movements never made it out
+        with self.lock, self.file_lock:
+            self.levels, self.size = {}, 0
+            self.identity = file_identity(os.stat(self.path))
+            sold = set()
+            tracked = {}        # sku -> when it was first received or counted
+            with metrics.timer("stock.rebuild"), open(self.path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    if line.strip():
+                        move = json.loads(line)
+                        self.apply(move)
+                        if move["reason"] == "sale":
+                            sold.add(move["ref"])
+                        else:
+                            tracked[move["sku"]] = min(tracked.get(move["sku"], move["time"]), move["time"])
+                    self.size += len(line)
+            booked = 0
+            if store is not None:
+                store.refresh()
+                checkpoint = store.checkpoint()
+                checked = self.checked or {}
+                later = store.since(checked.get("checkpoint"))
+                if later is None and tracked:
+                    # never checked, or the log was rewritten since: go by time
+                    overlap = datetime.timedelta(seconds=REBUILD_OVERLAP)
+                    start = (str(datetime.datetime.fromisoformat(checked["through"]) - overlap)
+                             if checked.get("through") else min(tracked.values()))
+                    later = store.read_entries(store.search(start=start))
+                through = checked.get("through", "")
+                for rec in later or []:
+                    through = max(through, rec["datetime"])
+                    if rec["receipt_id"] in sold:
+                        continue
+                    items = [i for i in rec["items"] if i.get("sku") in tracked and tracked[i["sku"]] <= rec["datetime"]]
+                    booked += len(self.sell(dict(rec, items=items)))
+                self.checked = {"checkpoint": checkpoint, "through": through}
+            self.save_snapshot()
+            return booked
+
+
+def low_stock(ledger, catalog, default=LOW_STOCK):
+    # (product, units left) for every tracked product at or under its reorder level
+    found = []
+    catalog.refresh()
+    for sku, left in ledger.snapshot().items():
+        p = catalog.products.get(sku)
+        if p is not None and left <= p.get("reorder_at", default):
+            found.append((p, left))
+    return sorted(found, key=lambda f: f[1])
+
+
+# ==========================
+# COMMAND LINE
+# ==========================
+def main(argv=None):
+    from catalog import Catalog, CATALOG_FILE
+    from storage import open_store
+
+    parser = argparse.ArgumentParser(description="Stock ledger tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="stock on hand and low-stock products")
+    for name, text in (("receive", "add delivered units"), ("count", "set units after a physical count")):
+        p = sub.add_parser(name, help=text)
+        p.add_argument("sku")
+        p.add_argument("qty", type=int)
+    r = sub.add_parser("rebuild", help="recompute stock from the ledger")
+    r.add_argument("--receipts", action="store_true", help="also book sales missing from the ledger")
+    parser.add_argument("--ledger", default=LEDGER_FILE)
+    parser.add_argument("--catalog", default=CATALOG_FILE)
+    args = parser.parse_args(argv)
+
+    ledger = StockLedger(args.ledger)
+    catalog = Catalog(args.catalog)
+    if args.command in ("receive", "count"):
+        if args.sku not in catalog.products:
+            print(f"Unknown SKU {args.sku!r}")
+            return 1
+        left = getattr(ledger, args.command)(args.sku, args.qty)
+        print(f"{catalog.name_of(args.sku)}: {left} on hand")
+    elif args.command == "rebuild":
+        booked = ledger.rebuild(open_store() if args.receipts else None)
+        print(f"Rebuilt stock for {len(ledger.levels)} products from {ledger.size} bytes"
+              + (f", booked {booked} missing sale lines" if args.receipts else ""))
+    else:
+        for sku, left in sorted(ledger.snapshot().items()):
+            print(f"{sku:>8}  {catalog.name_of(sku):<30} {left:>8}")
+        for p, left in low_stock(ledger, catalog):
+            print(f"LOW {p['name']}: {left} left")
+    ledger.save_snapshot()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import os
+import json
+import time
+import datetime
+import threading
+from collections import deque
+from functools import wraps
+
+# ==========================
+# METRICS
+# ==========================
+# Per-call timings, call counts and byte sizes for the hot paths, kept in one
+# registry by name. Each metric also holds its last HISTORY_SIZE durations so
+# the Diagnostics screen can show recent p50/p99 rather than an all-time mean.
+#
+#   @metrics.timed("load_transactions")        time every call of a function
+#   with metrics.timer("log.fsync") as t:      time a block; t.bytes = n to
+#       ...                                    record how much it moved
+#
+# POS_METRICS=0 turns all of it off: timed() then hands back the function
+# untouched and timer() a shared do-nothing context, so the cost is one
+# attribute lookup per block.
+
+ENABLED = os.environ.get("POS_METRICS", "1") not in ("0", "")
+METRICS_FILE = "pos_metrics.jsonl"
+HISTORY_SIZE = 1024
+
+
+class Metric:
+    __slots__ = ("name", "calls", "seconds", "bytes", "recent", "lock")
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.recent = deque(maxlen=HISTORY_SIZE)
+        self.lock = threading.Lock()
+
+    def record(self, seconds, size=0):
+        with self.lock:
+            self.calls += 1
+            self.seconds += seconds
+            self.bytes += size
+            self.recent.append(seconds)
+
+    def percentile(self, pct):
+        with self.lock:
+            recent = sorted(self.recent)
+        if not recent:
+            return 0.0
+        return recent[min(len(recent) - 1, int(len(recent) * pct / 100))]
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "total_ms": self.seconds * 1000,
+            "bytes": self.bytes,
+            "p50_ms": self.percentile(50) * 1000,
+            "p99_ms": self.percentile(99) * 1000,
+            "max_ms": max(self.recent, default=0.0) * 1000
+        }
+
+
+registry = {}
+registry_lock = threading.Lock()
+
+
+def get(name):
+    metric = registry.get(name)
+    if metric is None:
+        with registry_lock:
+            metric = registry.setdefault(name, Metric(name))
+    return metric
+
+
+class Timer:
+    __slots__ = ("metric", "start", "bytes")
+
+    def __init__(self, metric):
+        self.metric = metric
+        self.bytes = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metric.record(time.perf_counter() - self.start, self.bytes)
+        return False
+
+
+class NullTimer:
+    __slots__ = ()
+    bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def timer(name):
+    if not ENABLED:
+        return NULL_TIMER
+    return Timer(get(name))
+
+
+def timed(name):
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+        metric = get(name)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                metric.record(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+# ---------- reporting ----------
+def snapshot():
+    return {name: m.as_dict() for name, m in sorted(registry.items()) if m.calls}
+
+
+def lines():
+    if not ENABLED:
+        return ["Metrics are off (POS_METRICS=0)."]
+    found = snapshot()
+    if not found:
+        return ["Nothing measured yet."]
+    out = [f"{'name':<22}{'calls':>7}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'total ms':>10}{'bytes':>11}"]
+    for name, m in found.items():
+        out.append(f"{name:<22}{m['calls']:>7}{m['p50_ms']:>9.2f}{m['p99_ms']:>9.2f}"
+                   f"{m['max_ms']:>9.2f}{m['total_ms']:>10.1f}{m['bytes']:>11}")
+    return out
+
+
+def dump(user=None, path=METRICS_FILE):
+    # one JSON line per logout with everything this process measured so far
+    if not ENABLED or not any(m.calls for m in list(registry.values())):
+        return
+    line = {"time": str(datetime.datetime.now()), "pid": os.getpid(), "user": user, "metrics": snapshot()}
+    with open(path, "a") as f:
+        f.write(json.dumps(line) + "\n")
@@ -0,0 +1,64 @@
+import re
+import json
+import mmap
+from contextlib import contextmanager
+
+# ==========================
+# MEMORY-MAPPED LOG SCANS
+# ==========================
+# Building the index only needs five fields of every line (receipt_id,
+# datetime, method, total and the tombstone flag), not the items. Lines
+# written by json.dumps always lay a receipt out as
+#
+#   {"receipt_id": "...", "datetime": "...", "items": [...], "total": N, "method": "...", ...}
+#
+# so scan() maps the log, finds line ends with bytes searches and matches
+# those fields straight out of the buffer with one regex per line. A line
+# that doesn't look like that (hand-edited, escaped quotes, ...) is parsed
+# with json.loads.
+
+LINE = re.compile(rb'\{"receipt_id": "([^"\\]*)", (?:"deleted": true\}'
+                  rb'|"datetime": "([^"\\]*)", "items": .*"total": (-?\d+), "method": "([^"\\]*)")')
+
+
+@contextmanager
+def mapped(path):
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mm
+        finally:
+            mm.close()
+
+
+def fields(mm, start, end):
+    # (receipt_id, datetime, method, total, deleted) of the line at
+    # [start, end), or None when it has to be parsed properly. The match is
+    # greedy up to the last "total", which is the receipt's own: items come
+    # before it.
+    m = LINE.match(mm, start, end)
+    if m is None:
+        return None
+    rid, dt, total, method = m.groups()
+    if dt is None:
+        return rid.decode("utf-8"), "", None, 0, True
+    return rid.decode("utf-8"), dt.decode("utf-8"), method.decode("utf-8"), int(total), False
+
+
+def scan(path, start=0):
+    # (offset, length, fields) per complete line from `start` on, fields None
+    # for a blank line; stops at a torn last line, like the store does
+    with mapped(path) as mm:
+        end = len(mm)
+        pos = start
+        while pos < end:
+            nl = mm.find(b"\n", pos)
+            if nl == -1:
+                break
+            found = fields(mm, pos, nl)
+            if found is None and mm[pos:nl].strip():
+                rec = json.loads(mm[pos:nl])
+                found = (rec.get("receipt_id"), rec.get("datetime", ""), rec.get("method"),
+                         rec.get("total", 0), bool(rec.get("deleted")))
+            yield pos, nl + 1 - pos, found
+            pos = nl + 1
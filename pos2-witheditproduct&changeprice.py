@@ -1,9 +1,10 @@
-import os
-import json
-import uuid
-import datetime
 import time
 
+from pos_core import POS, POSError
+from screen import Screen
+import retention
+import metrics
+
 # ==========================
 # TERMINAL COLORS
 # ==========================
@@ -18,8 +19,10 @@ WHITE = "\033[97m"
 # ==========================
 # UTILITY FUNCTIONS
 # ==========================
+screen = Screen()
+
 def clear():
-    os.system("cls" if os.name=="nt" else "clear")
+    screen.clear()
 
 def header(text):
     print(CYAN + "╔" + "═"*60 + "╗")
@@ -38,48 +41,8 @@ def option(num, text):
 # ==========================
 # DATA
 # ==========================
-users = {
-    "admin": "1234",
-    "cashier": "1234"
-}
-
-products = [
-    {"name": "ID Lace", "price": 75},
-    {"name": "Logo", "price": 50},
-    {"name": "Cartolina", "price": 20},
-    {"name": "Bond Paper", "price": 1}
-]
-
-def load_transactions():
-    data = []
-    if not os.path.exists("transactions.json"):
-        open("transactions.json","w").close()
-    with open("transactions.json", "r") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                data.append(json.loads(line))
-    return data
-
-def save_transaction(cart, total, method, cash, change):
-    receipt_id = str(uuid.uuid4())
-    trans = {
-        "receipt_id": receipt_id,
-        "datetime": str(datetime.datetime.now()),
-        "items": cart,
-        "total": total,
-        "method": method,
-        "cash": cash,
-        "change": change
-    }
-    with open("transactions.json", "a") as f:
-        f.write(json.dumps(trans)+"\n")
-    success(f"Transaction saved! Receipt ID: {receipt_id}")
-
-def save_all_transactions(data):
-    with open("transactions.json", "w") as f:
-        for entry in data:
-            f.write(json.dumps(entry) + "\n")
+pos = POS()   # POS_STORAGE=sqlite for the SQLite backend
+PRODUCTS_SHOWN = 10
 
 # ==========================
 # NEW FUNCTION: EDIT PRODUCT
@@ -90,22 +53,19 @@ def edit_product():
         header("Edit Product & Price")
 
         print("Products:")
-        for idx, p in enumerate(products, start=1):
-            print(f"{idx}. {p['name']} - ₱{p['price']}")
+        show_products()
 
         print("\nB. Back")
-        choice = input("\nSelect product number: ").lower()
+        choice = input("\nEnter product code or ?name to search: ").strip()
 
-        if choice == "b":
+        if choice.lower() == "b":
             break
 
-        if not choice.isdigit() or not (1 <= int(choice) <= len(products)):
-            error("Invalid product number!")
+        selected = find_product(choice)
+        if selected is None:
             time.sleep(1)
             continue
 
-        selected = products[int(choice)-1]
-
         print(f"\nSelected: {selected['name']} - ₱{selected['price']}")
         print("1. Change Name")
         print("2. Change Price")
@@ -119,7 +79,7 @@ def edit_product():
                 error("Name cannot be empty!")
                 time.sleep(1)
                 continue
-            selected["name"] = new_name
+            pos.update_product(selected["sku"], name=new_name)
             success("Product name updated!")
             time.sleep(1)
 
@@ -130,7 +90,7 @@ def edit_product():
                 error("Invalid price!")
                 time.sleep(1)
                 continue
-            selected["price"] = int(new_price)
+            pos.update_product(selected["sku"], price=int(new_price))
             success("Product price updated!")
             time.sleep(1)
 
@@ -147,9 +107,8 @@ def login():
     clear()
     header("Login Page")
     print(f"{YELLOW}Hint: admin/1234 or cashier/1234{RESET}\n")
-    user = input("Username: ").lower()
-    password = input("Password: ")
-    if user in users and password == users[user]:
+    user = pos.login(input("Username: "), input("Password: "))
+    if user is not None:
         success("Login successful!")
         time.sleep(1)
         return user
@@ -161,6 +120,199 @@ def login():
 # ==========================
 # ADMIN DASHBOARD
 # ==========================
+PAGE_SIZE = 10
+
+def history_pager(entries=None):
+    start = 0
+    while True:
+        source = pos.transaction_entries() if entries is None else entries
+        count = len(source)
+        clear()
+        header("Transaction List")
+        if count == 0:
+            print(YELLOW + "No transactions found." + RESET)
+            input("Press Enter to return...")
+            return None
+        start = max(0, min(start, count - 1))
+        page = pos.list_transactions(start, PAGE_SIZE, source)
+        for idx, t in enumerate(page, start=start + 1):
+            print(f"{idx}. {t['receipt_id']} - {t['datetime']}")
+        print(f"\nShowing {start + 1}-{start + len(page)} of {count}")
+        print("N. Next page  P. Previous page  D. Jump to date  B. Back")
+
+        sel = input("\nSelect transaction number: ").lower()
+        if sel == "n":
+            if start + PAGE_SIZE < count:
+                start += PAGE_SIZE
+        elif sel == "p":
+            start -= PAGE_SIZE
+        elif sel == "d":
+            when = input("Date (YYYY-MM-DD or YYYY-MM-DD HH:MM): ").strip()
+            start = pos.find_date(when, source)
+        elif sel == "b":
+            return None
+        elif sel.isdigit() and start < int(sel) <= start + len(page):
+            return page[int(sel) - start - 1]
+        else:
+            error("Invalid selection!")
+            time.sleep(1)
+
+def search_transactions():
+    clear()
+    header("Search Transactions")
+    print("Leave a field blank to skip it.\n")
+    prefix = input("Receipt ID starts with: ").strip().lower()
+    start = input("From date (YYYY-MM-DD or YYYY-MM-DD HH:MM): ").strip()
+    end = input("To date (YYYY-MM-DD or YYYY-MM-DD HH:MM): ").strip()
+    method = input("Payment method (cash/card): ").strip().lower()
+    min_total = input("Minimum total: ").strip()
+    max_total = input("Maximum total: ").strip()
+    if not all(v.isdigit() for v in (min_total, max_total) if v):
+        error("Totals must be whole numbers!")
+        time.sleep(1)
+        return None
+    found = pos.search_transactions(prefix, start, end, method,
+                                    int(min_total) if min_total else None,
+                                    int(max_total) if max_total else None)
+    return history_pager(found)
+
+def parse_picks(text, count):
+    # "1,3,5-7" -> the set of numbers picked, or None if it isn't one
+    picks = set()
+    for part in text.replace(" ", "").split(","):
+        lo, _, hi = part.partition("-")
+        if not lo.isdigit() or (hi and not hi.isdigit()):
+            return None
+        lo, hi = int(lo), int(hi or lo)
+        if not 1 <= lo <= hi <= count:
+            return None
+        picks.update(range(lo, hi + 1))
+    return picks
+
+def bulk_delete():
+    clear()
+    header("Bulk Delete")
+    print("Leave a field blank to skip it.\n")
+    start = input("From date (YYYY-MM-DD or YYYY-MM-DD HH:MM): ").strip()
+    end = input("To date (YYYY-MM-DD or YYYY-MM-DD HH:MM): ").strip()
+    method = input("Payment method (cash/card): ").strip().lower()
+    found = pos.search_transactions("", start, end, method)
+    marked = set()
+    begin = 0
+    while True:
+        clear()
+        header("Bulk Delete")
+        if not found:
+            print(YELLOW + "No transactions found." + RESET)
+            input("Press Enter to continue...")
+            return
+        page = found[begin:begin + PAGE_SIZE]
+        for idx, e in enumerate(page, start=begin + 1):
+            mark = "[x]" if e[0] in marked else "[ ]"
+            print(f"{mark} {idx}. {e[0]} - {e[2]} - {e[3]} ₱{e[4]}")
+        print(f"\nShowing {begin + 1}-{begin + len(page)} of {len(found)}, {len(marked)} marked")
+        print("1,3,5-7 Mark/unmark  A. Mark all  N. Next page  P. Previous page  D. Delete marked  B. Back")
+
+        sel = input("\nChoose: ").lower().strip()
+        if sel == "n":
+            if begin + PAGE_SIZE < len(found):
+                begin += PAGE_SIZE
+        elif sel == "p":
+            begin = max(0, begin - PAGE_SIZE)
+        elif sel == "a":
+            marked = set() if len(marked) == len(found) else {e[0] for e in found}
+        elif sel == "b":
+            return
+        elif sel == "d":
+            if not marked:
+                error("Nothing marked!")
+                time.sleep(1)
+                continue
+            confirm = input(f"Delete {len(marked)} transactions? (y/n): ").lower()
+            if confirm == "y":
+                try:
+                    success(f"{pos.purge_transactions(marked)} transactions deleted!")
+                except POSError as e:
+                    error(str(e))
+                    time.sleep(1)
+                    continue
+                time.sleep(1)
+                return
+        else:
+            picks = parse_picks(sel, len(found))
+            if picks is None:
+                error("Invalid selection!")
+                time.sleep(1)
+                continue
+            for n in picks:
+                rid = found[n - 1][0]
+                if rid in marked:
+                    marked.discard(rid)
+                else:
+                    marked.add(rid)
+
+def retention_policy():
+    clear()
+    header("Retention Policy")
+    days = input(f"Keep how many days? (Enter = {retention.RETENTION_DAYS or 'all'}): ").strip()
+    if days and not days.isdigit():
+        error("Days must be a whole number!")
+        time.sleep(1)
+        return
+    days = int(days) if days else retention.RETENTION_DAYS
+    if not days:
+        print(YELLOW + "Retention is off: every transaction is kept." + RESET)
+        input("Press Enter to continue...")
+        return
+    expired = pos.expired_transactions(days)
+    print(f"\n{len(expired)} transactions from before {retention.cutoff(days)}.")
+    if not expired:
+        input("Press Enter to continue...")
+        return
+    where = f"archived to {retention.ARCHIVE_DIR}/ and " if retention.ARCHIVE_DIR else ""
+    confirm = input(f"They will be {where}removed. Continue? (y/n): ").lower()
+    if confirm == "y":
+        count, path = pos.apply_retention(days)
+        success(f"{count} transactions purged" + (f", archived to {path}" if path else "") + "!")
+        time.sleep(1)
+
+def sales_reports():
+    clear()
+    header("Sales Reports")
+    for line in pos.report_lines():
+        print(line)
+    input("\nPress Enter to return...")
+
+def diagnostics():
+    clear()
+    header("Diagnostics")
+    for line in metrics.lines():
+        print(line)
+    input("\nPress Enter to return...")
+
+def close_day():
+    clear()
+    header("Close Day")
+    try:
+        z = pos.preview_close()
+    except POSError as e:
+        error(str(e))
+        time.sleep(1)
+        return
+    for line in pos.zreport_lines(z):
+        print(line)
+    confirm = input("\nClose the day and seal these receipts? (y/n): ").lower()
+    if confirm != "y":
+        return
+    try:
+        z = pos.close_day("admin")
+    except POSError as e:
+        error(str(e))
+        time.sleep(1)
+        return
+    success(f"Day closed! Z-report #{z['number']} saved.")
+    input("Press Enter to return...")
+
 def admin_dashboard():
     while True:
         clear()
@@ -169,29 +321,20 @@ def admin_dashboard():
         option(1, "View Transaction History")
         option(2, "Logout")
         option(3, "Edit Product & Price")   # <== ADDED HERE
+        option(4, "Search Transactions")
+        option(5, "Sales Reports")
+        option(6, "Diagnostics")
+        option(7, "Bulk Delete")
+        option(8, "Retention Policy")
+        option(9, "Close Day (Z-Report)")
 
         choice = input("\nChoose option: ").lower()
-        if choice == "1":
-            # Show list
-            transactions = load_transactions()
-            clear()
-            header("Transaction List")
-            if not transactions:
-                print(YELLOW + "No transactions found." + RESET)
-                input("Press Enter to return...")
-                continue
-
-            for idx, t in enumerate(transactions, start=1):
-                print(f"{idx}. {t['receipt_id']} - {t['datetime']}")
-
-            sel = input("\nSelect transaction number: ")
-            if not sel.isdigit() or not (1 <= int(sel) <= len(transactions)):
-                error("Invalid selection!")
-                time.sleep(1)
+        if choice in ("1", "4"):
+            # Page through transactions (all of them, or search results)
+            selected = history_pager() if choice == "1" else search_transactions()
+            if selected is None:
                 continue
 
-            selected = transactions[int(sel) - 1]
-
             # Display details
             while True:
                 clear()
@@ -212,8 +355,12 @@ def admin_dashboard():
                 if sub == "1":
                     confirm = input("Are you sure? (y/n): ").lower()
                     if confirm == "y":
-                        transactions.remove(selected)
-                        save_all_transactions(transactions)
+                        try:
+                            pos.delete_transaction(selected["receipt_id"])
+                        except POSError as e:
+                            error(str(e))
+                            time.sleep(1)
+                            continue
                         success("Transaction deleted!")
                         time.sleep(1)
                         break
@@ -229,6 +376,21 @@ def admin_dashboard():
         elif choice == "3":
             edit_product()   # <<< CALL ADDED FUNCTION
 
+        elif choice == "5":
+            sales_reports()
+
+        elif choice == "6":
+            diagnostics()
+
+        elif choice == "7":
+            bulk_delete()
+
+        elif choice == "8":
+            retention_policy()
+
+        elif choice == "9":
+            close_day()
+
         else:
             error("Invalid input!")
             time.sleep(1)
@@ -236,70 +398,113 @@ def admin_dashboard():
 # ==========================
 # CASHIER DASHBOARD
 # ==========================
-def cashier_dashboard():
-    cart = []
-    total = 0
-
-    while True:
-        clear()
+def show_products():
+    for p in pos.products(PRODUCTS_SHOWN):
+        print(f"{p['sku']}. {p['name']} - ₱{p['price']}")
+    if pos.product_count() > PRODUCTS_SHOWN:
+        print(f"... and {pos.product_count() - PRODUCTS_SHOWN} more (type ?name to search)")
+
+def find_product(code):
+    # a SKU/barcode, or ?name to search the catalog by name
+    if code.startswith("?"):
+        matches = pos.search_products(code[1:])
+        if not matches:
+            error("No matching products!")
+            return None
+        for idx, p in enumerate(matches, start=1):
+            print(f"{idx}. [{p['sku']}] {p['name']} - ₱{p['price']}")
+        sel = input("Select product: ")
+        if sel.isdigit() and 1 <= int(sel) <= len(matches):
+            return matches[int(sel)-1]
+        error("Invalid selection!")
+        return None
+    product = pos.lookup_product(code)
+    if product is None:
+        error("Unknown product code!")
+    return product
+
+CART_SHOWN = 10
+LOW_STOCK_SHOWN = 5
+
+def draw_cashier(cart):
+    # one frame for both the menu and the add-item loop, so switching
+    # between them (or adding an item) only redraws the cart lines
+    with screen.frame():
         header("Cashier Dashboard")
         print("Options:")
         option(1, "Add Item to Cart")
         option(2, "Checkout")
         option(3, "Logout")
+        option("E", "Edit Cart")
 
         print("\n" + CYAN + "=== Products ===" + RESET)
-        for idx, p in enumerate(products, start=1):
-            print(f"{idx}. {p['name']} - ₱{p['price']}")
+        show_products()
+        low = pos.low_stock()
+        if low:
+            shown = ", ".join(f"{p['name']} ({left})" for p, left in low[:LOW_STOCK_SHOWN])
+            more = f" +{len(low) - LOW_STOCK_SHOWN} more" if len(low) > LOW_STOCK_SHOWN else ""
+            print(YELLOW + f"Low stock: {shown}{more}" + RESET)
 
         print("\n" + MAGENTA + "=== Cart ===" + RESET)
         if cart:
-            for i in cart:
-                print(f"{i['name']} x{i['qty']} = ₱{i['total']}")
-            print(f"Total: ₱{total}")
+            if len(cart) > CART_SHOWN:
+                print(f"... {len(cart) - CART_SHOWN} earlier lines")
+            for i in cart.tail(CART_SHOWN):
+                print(f"[{i.sku}] {i.name} x{i.qty} = ₱{i.total}")
+            print(f"Total: ₱{cart.total}")
         else:
             print(YELLOW + "Cart is empty." + RESET)
 
+def add_to_cart(cart, product):
+    qty = input(f"Quantity for {product['name']}: ")
+    if qty.isdigit() and int(qty)>0:
+        qty = int(qty)
+        line = pos.add_item(cart, product, qty)
+        success(f"Added {qty} x {product['name']} = ₱{qty*line.price}")
+        left = pos.stock_level(product["sku"])
+        if left is not None and line.qty > left:
+            error(f"Only {max(left, 0)} {product['name']} left in stock!")
+            time.sleep(0.5)
+        time.sleep(0.5)
+    else:
+        error("Invalid quantity!")
+
+def edit_cart(cart):
+    sku = input("Product code to change, or V to void the cart: ").strip()
+    if sku.lower() == "v":
+        if input("Void the whole cart? (y/n): ").lower() == "y":
+            cart.void()
+            success("Cart voided!")
+            time.sleep(0.5)
+    elif sku in cart:
+        qty = input(f"New quantity for {cart[sku].name} (0 removes): ")
+        if qty.isdigit():
+            cart.set_qty(sku, int(qty))
+        else:
+            error("Invalid quantity!")
+            time.sleep(0.5)
+    else:
+        error("That product is not in the cart!")
+        time.sleep(0.5)
+
+def cashier_dashboard():
+    cart = pos.new_cart()
+
+    while True:
+        draw_cashier(cart)
+
         choice = input("\nChoose option: ").lower()
 
         if choice == "1":
             while True:
-                clear()
-                header("Cashier Dashboard")
-                print("Options:")
-                option(1, "Add Item to Cart")
-                option(2, "Checkout")
-                option(3, "Logout")
-
-                print("\n=== Products ===")
-                for idx, p in enumerate(products, start=1):
-                    print(f"{idx}. {p['name']} - ₱{p['price']}")
-
-                print("\n=== Cart ===")
-                if cart:
-                    for i in cart:
-                        print(f"{i['name']} x{i['qty']} = ₱{i['total']}")
-                    print(f"Total: ₱{total}")
-                else:
-                    print("Cart is empty.")
+                draw_cashier(cart)
 
-                product_num = input("\nSelect product number or B to go back: ").lower()
-                if product_num == "b":
+                code = input("\nEnter product code, ?name to search, or B to go back: ").strip()
+                if code.lower() == "b":
                     break
-                if product_num.isdigit() and 1 <= int(product_num) <= len(products):
-                    product = products[int(product_num)-1]
-                    qty = input(f"Quantity for {product['name']}: ")
-                    if qty.isdigit() and int(qty)>0:
-                        qty = int(qty)
-                        cost = qty*product['price']
-                        cart.append({"name":product['name'], "qty":qty, "price":product['price'], "total":cost})
-                        total += cost
-                        success(f"Added {qty} x {product['name']} = ₱{cost}")
-                        time.sleep(0.5)
-                    else:
-                        error("Invalid quantity!")
-                else:
-                    error("Invalid product number!")
+                product = find_product(code)
+                if product is not None:
+                    add_to_cart(cart, product)
 
         elif choice == "2":
             if not cart:
@@ -308,39 +513,42 @@ def cashier_dashboard():
                 continue
 
             method = input("Payment method (cash/card): ").lower()
-            if method not in ["cash","card"]:
-                error("Invalid method!")
+            cash = None
+            if method=="cash":
+                cash = input("Enter cash amount: ")
+                cash = int(cash) if cash.isdigit() else None
+
+            try:
+                trans = pos.checkout(cart, method, cash)
+            except POSError as e:
+                error(str(e))
                 time.sleep(0.5)
                 continue
 
-            if method=="cash":
-                cash = input("Enter cash amount: ")
-                if not cash.isdigit() or int(cash)<total:
-                    error("Insufficient cash!")
-                    time.sleep(0.5)
-                    continue
-                cash = int(cash)
-                change = cash-total
-            else:
-                cash = total
-                change = 0
-
-            save_transaction(cart, total, method, cash, change)
-            cart.clear()
-            total = 0
+            success(f"Transaction saved! Receipt ID: {trans['receipt_id']}")
             time.sleep(1)
 
         elif choice == "3":
             break
+
+        elif choice == "e":
+            edit_cart(cart)
+
         else:
             error("Invalid input!")
 
 # ==========================
 # MAIN LOOP
 # ==========================
-while True:
-    user = login()
-    if user=="admin":
-        admin_dashboard()
-    elif user=="cashier":
-        cashier_dashboard()
+def main():
+    while True:
+        user = login()
+        if user=="admin":
+            admin_dashboard()
+        elif user=="cashier":
+            cashier_dashboard()
+        if user is not None:
+            metrics.dump(user)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,9 @@
-import os
-import json
-import uuid
-import datetime
 import time
 
+from pos_core import POS, POSError
+from screen import Screen
+import metrics
+
 # ==========================
 # TERMINAL COLORS
 # ==========================
@@ -18,8 +18,10 @@ WHITE = "\033[97m"
 # ==========================
 # UTILITY FUNCTIONS
 # ==========================
+screen = Screen()
+
 def clear():
-    os.system("cls" if os.name=="nt" else "clear")
+    screen.clear()
 
 def header(text):
     print(CYAN + "╔" + "═"*60 + "╗")
@@ -38,43 +40,8 @@ def option(num, text):
 # ==========================
 # DATA
 # ==========================
-users = {
-    "admin": "1234",
-    "cashier": "1234"
-}
-
-products = [
-    {"name": "ID Lace", "price": 75},
-    {"name": "Logo", "price": 50},
-    {"name": "Cartolina", "price": 20},
-    {"name": "Bond Paper", "price": 1}
-]
-
-def load_transactions():
-    data = []
-    if not os.path.exists("transactions.json"):
-        open("transactions.json","w").close()
-    with open("transactions.json", "r") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                data.append(json.loads(line))
-    return data
-
-def save_transaction(cart, total, method, cash, change):
-    receipt_id = str(uuid.uuid4())
-    trans = {
-        "receipt_id": receipt_id,
-        "datetime": str(datetime.datetime.now()),
-        "items": cart,
-        "total": total,
-        "method": method,
-        "cash": cash,
-        "change": change
-    }
-    with open("transactions.json", "a") as f:
-        f.write(json.dumps(trans)+"\n")
-    success(f"Transaction saved! Receipt ID: {receipt_id}")
+pos = POS()   # POS_STORAGE=sqlite for the SQLite backend
+PRODUCTS_SHOWN = 10
 
 # ==========================
 # LOGIN
@@ -83,9 +50,8 @@ def login():
     clear()
     header("Login Page")
     print(f"{YELLOW}Hint: admin/1234 or cashier/1234{RESET}\n")
-    user = input("Username ▶ ").lower()
-    password = input("Password ▶ ")
-    if user in users and password == users[user]:
+    user = pos.login(input("Username ▶ "), input("Password ▶ "))
+    if user is not None:
         success("Login successful!")
         time.sleep(1)
         return user
@@ -97,8 +63,101 @@ def login():
 # ==========================
 # ADMIN DASHBOARD
 # ==========================
+PAGE_SIZE = 10
+
+def history_pager(entries=None):
+    # without entries, pages come straight from the store (LIMIT/OFFSET on
+    # SQLite), so a page turn never lists the whole history
+    start = 0
+    while True:
+        count = pos.transaction_count() if entries is None else len(entries)
+        clear()
+        header("Transaction List")
+        if count == 0:
+            print(YELLOW + "No transactions found." + RESET)
+            input("Press Enter to continue...")
+            return None
+        start = max(0, min(start, count - 1))
+        page = pos.list_transactions(start, PAGE_SIZE, entries)
+        for idx, t in enumerate(page, start=start + 1):
+            print(f"{idx}. {t['receipt_id']} - {t['datetime']}")
+        print(f"\nShowing {start + 1}-{start + len(page)} of {count}")
+        print("N. Next page  P. Previous page  D. Jump to date  B. Back")
+
+        sel = input("\nSelect transaction number ▶ ").lower()
+        if sel == "n":
+            if start + PAGE_SIZE < count:
+                start += PAGE_SIZE
+        elif sel == "p":
+            start -= PAGE_SIZE
+        elif sel == "d":
+            when = input("Date (YYYY-MM-DD or YYYY-MM-DD HH:MM) ▶ ").strip()
+            start = pos.find_date(when, entries)
+        elif sel == "b":
+            return None
+        elif sel.isdigit() and start < int(sel) <= start + len(page):
+            return page[int(sel) - start - 1]
+        else:
+            error("Invalid selection!")
+            time.sleep(1)
+
+def search_transactions():
+    clear()
+    header("Search Transactions")
+    print("Leave a field blank to skip it.\n")
+    prefix = input("Receipt ID starts with ▶ ").strip().lower()
+    start = input("From date (YYYY-MM-DD or YYYY-MM-DD HH:MM) ▶ ").strip()
+    end = input("To date (YYYY-MM-DD or YYYY-MM-DD HH:MM) ▶ ").strip()
+    method = input("Payment method (cash/card) ▶ ").strip().lower()
+    min_total = input("Minimum total ▶ ").strip()
+    max_total = input("Maximum total ▶ ").strip()
+    if not all(v.isdigit() for v in (min_total, max_total) if v):
+        error("Totals must be whole numbers!")
+        time.sleep(1)
+        return None
+    found = pos.search_transactions(prefix, start, end, method,
+                                    int(min_total) if min_total else None,
+                                    int(max_total) if max_total else None)
+    return history_pager(found)
+
+def sales_reports():
+    clear()
+    header("Sales Reports")
+    for line in pos.report_lines():
+        print(line)
+    input("\nPress Enter to return...")
+
+def diagnostics():
+    clear()
+    header("Diagnostics")
+    for line in metrics.lines():
+        print(line)
+    input("\nPress Enter to return...")
+
+def close_day():
+    clear()
+    header("Close Day")
+    try:
+        z = pos.preview_close()
+    except POSError as e:
+        error(str(e))
+        time.sleep(1)
+        return
+    for line in pos.zreport_lines(z):
+        print(line)
+    confirm = input("\nClose the day and seal these receipts? (y/n) ▶ ").lower()
+    if confirm != "y":
+        return
+    try:
+        z = pos.close_day("admin")
+    except POSError as e:
+        error(str(e))
+        time.sleep(1)
+        return
+    success(f"Day closed! Z-report #{z['number']} saved.")
+    input("Press Enter to return...")
+
 def admin_dashboard():
-    transactions = load_transactions()
     selected_detail = None
 
     while True:
@@ -107,27 +166,26 @@ def admin_dashboard():
         print("Options:")
         option(1, "View Transaction History")
         option(2, "Logout")
+        option(3, "Search Transactions")
+        option(4, "Sales Reports")
+        option(5, "Diagnostics")
+        option(6, "Close Day (Z-Report)")
 
         if selected_detail is None:
             choice = input("\nChoose option ▶ ").lower()
             if choice == "1":
-                # Show list of transactions
-                clear()
-                header("Transaction List")
-                if transactions:
-                    for idx, t in enumerate(transactions, start=1):
-                        print(f"{idx}. {t['receipt_id']} - {t['datetime']}")
-                    sel = input("\nSelect transaction number ▶ ")
-                    if sel.isdigit() and 1 <= int(sel) <= len(transactions):
-                        selected_detail = transactions[int(sel)-1]
-                    else:
-                        error("Invalid selection!")
-                        time.sleep(1)
-                else:
-                    print(YELLOW + "No transactions found." + RESET)
-                    input("Press Enter to continue...")
+                # Page through transactions
+                selected_detail = history_pager()
             elif choice == "2":
                 break
+            elif choice == "3":
+                selected_detail = search_transactions()
+            elif choice == "4":
+                sales_reports()
+            elif choice == "5":
+                diagnostics()
+            elif choice == "6":
+                close_day()
             else:
                 error("Invalid input!")
                 time.sleep(1)
@@ -153,73 +211,116 @@ def admin_dashboard():
 # ==========================
 # CASHIER DASHBOARD
 # ==========================
-def cashier_dashboard():
-    cart = []
-    total = 0
+def show_products():
+    for p in pos.products(PRODUCTS_SHOWN):
+        print(f"{p['sku']}. {p['name']} - ₱{p['price']}")
+    total = pos.product_count()
+    if total > PRODUCTS_SHOWN:
+        print(f"... and {total - PRODUCTS_SHOWN} more (type ?name to search)")
 
-    while True:
-        clear()
+def find_product(code):
+    # a SKU/barcode, or ?name to search the catalog by name
+    if code.startswith("?"):
+        matches = pos.search_products(code[1:])
+        if not matches:
+            error("No matching products!")
+            return None
+        for idx, p in enumerate(matches, start=1):
+            print(f"{idx}. [{p['sku']}] {p['name']} - ₱{p['price']}")
+        sel = input("Select product ▶ ")
+        if sel.isdigit() and 1 <= int(sel) <= len(matches):
+            return matches[int(sel)-1]
+        error("Invalid selection!")
+        return None
+    product = pos.lookup_product(code)
+    if product is None:
+        error("Unknown product code!")
+    return product
+
+CART_SHOWN = 10
+LOW_STOCK_SHOWN = 5
+
+def draw_cashier(cart):
+    # one frame for both the menu and the add-item loop, so switching
+    # between them (or adding an item) only redraws the cart lines
+    with screen.frame():
         header("Cashier Dashboard")
         print("Options:")
         option(1, "Add Item to Cart")
         option(2, "Checkout")
         option(3, "Logout")
+        option("E", "Edit Cart")
 
-        # Show products
         print("\n" + CYAN + "=== Products ===" + RESET)
-        for idx, p in enumerate(products, start=1):
-            print(f"{idx}. {p['name']} - ₱{p['price']}")
+        show_products()
+        low = pos.low_stock()
+        if low:
+            shown = ", ".join(f"{p['name']} ({left})" for p, left in low[:LOW_STOCK_SHOWN])
+            more = f" +{len(low) - LOW_STOCK_SHOWN} more" if len(low) > LOW_STOCK_SHOWN else ""
+            print(YELLOW + f"Low stock: {shown}{more}" + RESET)
 
-        # Show cart
         print("\n" + MAGENTA + "=== Cart ===" + RESET)
         if cart:
-            for i in cart:
-                print(f"{i['name']} x{i['qty']} = ₱{i['total']}")
-            print(f"Total: ₱{total}")
+            if len(cart) > CART_SHOWN:
+                print(f"... {len(cart) - CART_SHOWN} earlier lines")
+            for i in cart.tail(CART_SHOWN):
+                print(f"[{i.sku}] {i.name} x{i.qty} = ₱{i.total}")
+            print(f"Total: ₱{cart.total}")
         else:
             print(YELLOW + "Cart is empty." + RESET)
 
-        choice = input("\nChoose option ▶ ").lower()
+def add_to_cart(cart, product):
+    qty = input(f"Quantity for {product['name']} ▶ ")
+    if qty.isdigit() and int(qty)>0:
+        qty = int(qty)
+        line = pos.add_item(cart, product, qty)
+        success(f"Added {qty} x {product['name']} = ₱{qty*line.price}")
+        left = pos.stock_level(product["sku"])
+        if left is not None and line.qty > left:
+            error(f"Only {max(left, 0)} {product['name']} left in stock!")
+            time.sleep(0.5)
+        time.sleep(0.5)
+    else:
+        error("Invalid quantity!")
+
+def edit_cart(cart):
+    sku = input("Product code to change, or V to void the cart ▶ ").strip()
+    if sku.lower() == "v":
+        if input("Void the whole cart? (y/n) ▶ ").lower() == "y":
+            cart.void()
+            success("Cart voided!")
+            time.sleep(0.5)
+    elif sku in cart:
+        qty = input(f"New quantity for {cart[sku].name} (0 removes) ▶ ")
+        if qty.isdigit():
+            cart.set_qty(sku, int(qty))
+        else:
+            error("Invalid quantity!")
+            time.sleep(0.5)
+    else:
+        error("That product is not in the cart!")
+        time.sleep(0.5)
+
+def cashier_dashboard():
+    cart = pos.new_cart()
+
+    while True:
+        draw_cashier(cart)
+
+        raw = input("\nChoose option or enter a product code ▶ ").strip()
+        choice = raw.lower()
 
         if choice == "1":
             # Add item to cart
             while True:
-                clear()
-                header("Cashier Dashboard")
-                print("Options:")
-                option(1, "Add Item to Cart")
-                option(2, "Checkout")
-                option(3, "Logout")
-
-                print("\n=== Products ===")
-                for idx, p in enumerate(products, start=1):
-                    print(f"{idx}. {p['name']} - ₱{p['price']}")
-
-                print("\n=== Cart ===")
-                if cart:
-                    for i in cart:
-                        print(f"{i['name']} x{i['qty']} = ₱{i['total']}")
-                    print(f"Total: ₱{total}")
-                else:
-                    print("Cart is empty.")
-
-                product_num = input("\nSelect product number or B to go back ▶ ").lower()
-                if product_num == "b":
+                draw_cashier(cart)
+
+                code = input("\nEnter product code, ?name to search, or B to go back ▶ ").strip()
+                if code.lower() == "b":
                     break
-                if product_num.isdigit() and 1 <= int(product_num) <= len(products):
-                    product = products[int(product_num)-1]
-                    qty = input(f"Quantity for {product['name']} ▶ ")
-                    if qty.isdigit() and int(qty)>0:
-                        qty = int(qty)
-                        cost = qty*product['price']
-                        cart.append({"name":product['name'], "qty":qty, "price":product['price'], "total":cost})
-                        total += cost
-                        success(f"Added {qty} x {product['name']} = ₱{cost}")
-                        time.sleep(0.5)
-                    else:
-                        error("Invalid quantity!")
-                else:
-                    error("Invalid product number!")
+                product = find_product(code)
+                if product is not None:
+                    add_to_cart(cart, product)
         elif choice == "2":
             # Checkout
             if not cart:
@@ -227,53 +328,43 @@ def cashier_dashboard():
                 time.sleep(0.5)
                 continue
             method = input("Payment method (cash/card) ▶ ").lower()
-            if method not in ["cash","card"]:
-                error("Invalid method!")
-                time.sleep(0.5)
-                continue
+            cash = None
             if method=="cash":
                 cash = input("Enter cash amount ▶ ")
-                if not cash.isdigit() or int(cash)<total:
-                    error("Insufficient cash!")
-                    time.sleep(0.5)
-                    continue
-                cash = int(cash)
-                change = cash-total
-            else:
-                cash = total
-                change = 0
-            save_transaction(cart, total, method, cash, change)
-            cart.clear()
-            total = 0
+                cash = int(cash) if cash.isdigit() else None
+            try:
+                trans = pos.checkout(cart, method, cash)
+            except POSError as e:
+                error(str(e))
+                time.sleep(0.5)
+                continue
+            success(f"Transaction saved! Receipt ID: {trans['receipt_id']}")
             time.sleep(1)
         elif choice=="3":
             break
-        elif choice.isdigit():
-            # Quick add product by number
-            product_num = int(choice)
-            if 1<=product_num<=len(products):
-                product = products[product_num-1]
-                qty = input(f"Quantity for {product['name']} ▶ ")
-                if qty.isdigit() and int(qty)>0:
-                    qty = int(qty)
-                    cost = qty*product['price']
-                    cart.append({"name":product['name'], "qty":qty, "price":product['price'], "total":cost})
-                    total += cost
-                    success(f"Added {qty} x {product['name']} = ₱{cost}")
-                    time.sleep(0.5)
-                else:
-                    error("Invalid quantity!")
-            else:
-                error("Invalid product number!")
+        elif choice=="e":
+            edit_cart(cart)
+        elif raw:
+            # Quick add product by code
+            product = find_product(raw)
+            if product is not None:
+                add_to_cart(cart, product)
         else:
             error("Invalid input!")
 
 # ==========================
 # MAIN LOOP
 # ==========================
-while True:
-    user = login()
-    if user=="admin":
-        admin_dashboard()
-    elif user=="cashier":
-        cashier_dashboard()
+def main():
+    pos.store   # open it up front, which also starts syncing when POS_CENTRAL is set
+    while True:
+        user = login()
+        if user=="admin":
+            admin_dashboard()
+        elif user=="cashier":
+            cashier_dashboard()
+        if user is not None:
+            metrics.dump(user)
+
+if __name__ == "__main__":
+    main()
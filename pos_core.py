@@ -0,0 +1,296 @@
+import uuid
+import datetime
+import threading
+from functools import cached_property
+
+from storage import open_store
+from reports import SalesReport, SNAPSHOT_FILE
+from catalog import Catalog, CATALOG_FILE
+from cart import Cart
+import inventory
+import retention
+import zreport
+import sync
+import metrics
+
+# ==========================
+# POS CORE
+# ==========================
+# Everything the terminals do, minus the terminal: login, catalog lookups,
+# carts, checkout, history and reports. Nothing here prints, sleeps or reads
+# input, so it can be imported cheaply and driven from scripts, benchmarks
+# or a server. Stores are only opened the first time they are used.
+#
+#   pos = POS()
+#   cart = pos.new_cart()
+#   pos.add_item(cart, "2", 3)
+#   receipt = pos.checkout(cart, "cash", 200)
+
+USERS = {
+    "admin": "1234",
+    "cashier": "1234"
+}
+METHODS = ["cash", "card"]
+
+
+class POSError(ValueError):
+    pass
+
+
+class POS:
+    def __init__(self, storage=None, catalog_path=CATALOG_FILE, snapshot_path=SNAPSHOT_FILE, store_path=None,
+                 stock_path=inventory.LEDGER_FILE, zreport_path=zreport.ZREPORT_FILE):
+        self.storage = storage              # None = POS_STORAGE or json
+        self.store_path = store_path        # None = the backend's usual file
+        self.catalog_path = catalog_path
+        self.snapshot_path = snapshot_path
+        self.stock_path = stock_path
+        self.zreport_path = zreport_path
+        self.cache_lock = threading.Lock()
+        self.cached = None                  # load_transactions() result so far
+        self.cached_ids = set()
+        self.cached_at = None               # store checkpoint it is current to
+        self.low_stock_at = None            # (ledger size, catalog stamp) of low_stock_found
+        self.low_stock_found = []
+
+    @cached_property
+    def store(self):
+        store = open_store(self.storage, self.store_path)
+        if sync.CENTRAL:
+            # a till restarting with receipts central hasn't got sends them
+            # now rather than after its next sale
+            self.syncer = sync.Syncer(store)
+            self.syncer.poke()
+        return store
+
+    @cached_property
+    def catalog(self):
+        return Catalog(self.catalog_path)
+
+    @cached_property
+    def stock(self):
+        return inventory.StockLedger(self.stock_path)
+
+    @cached_property
+    def syncer(self):
+        return sync.Syncer(self.store)
+
+    @cached_property
+    def closes(self):
+        return zreport.ZReports(self.zreport_path)
+
+    @cached_property
+    def report(self):
+        return SalesReport(self.store, self.snapshot_path, self.catalog, self.closes)
+
+    # ---------- users ----------
+    def login(self, user, password):
+        user = user.lower()
+        if user in USERS and password == USERS[user]:
+            return user
+        return None
+
+    # ---------- catalog ----------
+    def products(self, count):
+        return self.catalog.first(count)
+
+    def product_count(self):
+        return len(self.catalog)
+
+    def lookup_product(self, code):
+        return self.catalog.lookup(code)
+
+    def search_products(self, prefix, limit=10):
+        return self.catalog.search(prefix, limit)
+
+    def update_product(self, sku, name=None, price=None):
+        changes = {}
+        if name is not None:
+            if not name.strip():
+                raise POSError("Name cannot be empty!")
+            changes["name"] = name.strip()
+        if price is not None:
+            if price < 0:
+                raise POSError("Invalid price!")
+            changes["price"] = price
+        self.catalog.update(sku, **changes)
+
+    # ---------- carts ----------
+    def new_cart(self):
+        return Cart()
+
+    def add_item(self, cart, product, qty):
+        # product may be a catalog entry or a SKU/barcode
+        if isinstance(product, str):
+            code = product
+            product = self.lookup_product(code)
+            if product is None:
+                raise POSError(f"Unknown product code {code!r}!")
+        if qty <= 0:
+            raise POSError("Invalid quantity!")
+        return cart.add(product, qty)
+
+    @metrics.timed("checkout")
+    def checkout(self, cart, method, cash=None):
+        if not cart:
+            raise POSError("Cart is empty!")
+        if method not in METHODS:
+            raise POSError("Invalid method!")
+        if method == "cash":
+            if cash is None or cash < cart.total:
+                raise POSError("Insufficient cash!")
+            change = cash - cart.total
+        else:
+            cash = cart.total
+            change = 0
+        trans = self.save_transaction(cart.items(), cart.total, method, cash, change)
+        # only once the receipt is durable; see inventory.py for a crash in between
+        self.stock.sell(trans)
+        if sync.CENTRAL:
+            self.syncer.poke()      # background; checkout never waits on the network
+        cart.void()
+        return trans
+
+    # ---------- transactions ----------
+    @metrics.timed("save_transaction")
+    def save_transaction(self, items, total, method, cash, change):
+        trans = {
+            "receipt_id": str(uuid.uuid4()),
+            "datetime": str(datetime.datetime.now()),
+            "items": items,
+            "total": total,
+            "method": method,
+            "cash": cash,
+            "change": change
+        }
+        self.store.append(trans)
+        return trans
+
+    @metrics.timed("load_transactions")
+    def load_transactions(self):
+        # only what was appended since the last call is read; a delete,
+        # rewrite or rotation makes since() give up and we reload everything
+        with self.cache_lock:
+            self.store.refresh()
+            checkpoint = self.store.checkpoint()
+            newer = self.store.since(self.cached_at) if self.cached is not None else None
+            if newer is None:
+                with metrics.timer("load_transactions.full"):
+                    self.cached = list(self.store.records())
+                    self.cached_ids = {t["receipt_id"] for t in self.cached}
+            else:
+                # the checkpoint is taken before reading, so a receipt
+                # appended in between can come back twice
+                for t in newer:
+                    if t["receipt_id"] not in self.cached_ids:
+                        self.cached_ids.add(t["receipt_id"])
+                        self.cached.append(t)
+            self.cached_at = checkpoint
+            return list(self.cached)
+
+    @metrics.timed("save_all_transactions")
+    def save_all_transactions(self, data):
+        self.store.rewrite(data)
+
+    def transaction_entries(self):
+        return self.store.live_entries()
+
+    def transaction_count(self):
+        return len(self.store)
+
+    @metrics.timed("list_transactions")
+    def list_transactions(self, start=0, count=10, entries=None):
+        return list(self.store.page(start, count, entries))
+
+    def find_date(self, when, entries=None):
+        return self.store.find_date(when, entries)
+
+    def search_transactions(self, prefix="", start="", end="", method="", min_total=None, max_total=None):
+        return self.store.search(prefix, start, end, method, min_total, max_total)
+
+    def get_transaction(self, receipt_id):
+        return self.store.get(receipt_id)
+
+    def sealed(self, receipt_ids):
+        # the ones a Z-report has already closed
+        through = self.closes.sealed_through()
+        if not through:
+            return set()
+        ids = set(receipt_ids)
+        return {e[0] for e in self.store.search(end=through) if e[2] <= through and e[0] in ids}
+
+    def delete_transaction(self, receipt_id):
+        if self.sealed([receipt_id]):
+            raise POSError("That day is closed; its receipts can't be deleted!")
+        return self.store.delete(receipt_id)
+
+    @metrics.timed("purge_transactions")
+    def purge_transactions(self, receipt_ids):
+        # one pass over the store however many there are
+        receipt_ids = set(receipt_ids)
+        sealed = self.sealed(receipt_ids)
+        if sealed:
+            raise POSError(f"{len(sealed)} of them are in closed days and can't be deleted!")
+        return self.store.purge(receipt_ids)
+
+    def expired_transactions(self, days=None):
+        return retention.expired(self.store, retention.RETENTION_DAYS if days is None else days)
+
+    @metrics.timed("apply_retention")
+    def apply_retention(self, days=None, archive_dir=None):
+        return retention.apply(self.store, retention.RETENTION_DAYS if days is None else days,
+                               retention.ARCHIVE_DIR if archive_dir is None else archive_dir)
+
+    # ---------- stock ----------
+    def stock_level(self, sku):
+        return self.stock.level(sku)
+
+    def receive_stock(self, sku, qty):
+        if self.lookup_product(sku) is None:
+            raise POSError(f"Unknown product code {sku!r}!")
+        if qty <= 0:
+            raise POSError("Invalid quantity!")
+        return self.stock.receive(sku, qty)
+
+    def count_stock(self, sku, qty):
+        if self.lookup_product(sku) is None:
+            raise POSError(f"Unknown product code {sku!r}!")
+        if qty < 0:
+            raise POSError("Invalid quantity!")
+        return self.stock.count(sku, qty)
+
+    def low_stock(self):
+        # only worked out again when the ledger or the catalog changed
+        with self.stock.lock:
+            self.stock.refresh()
+            self.catalog.refresh()
+            key = (self.stock.size, self.catalog.stamp)
+            if key != self.low_stock_at:
+                self.low_stock_found = inventory.low_stock(self.stock, self.catalog)
+                self.low_stock_at = key
+            return self.low_stock_found
+
+    # ---------- reports ----------
+    def report_lines(self):
+        return self.report.lines()
+
+    def preview_close(self):
+        try:
+            return self.closes.preview(self.store)
+        except ValueError as e:
+            raise POSError(str(e))
+
+    def close_day(self, user=None):
+        try:
+            z = self.closes.close(self.store, user)
+        except ValueError as e:
+            raise POSError(str(e))
+        # so the next start only folds in receipts from after the close
+        self.report.save_snapshot()
+        return z
+
+    def zreports(self):
+        return self.closes.all()
+
+    def zreport_lines(self, z):
+        return zreport.lines(z, self.catalog)
@@ -0,0 +1,191 @@
+import os
+import json
+import atexit
+
+# ==========================
+# SALES REPORTS
+# ==========================
+# Running totals kept up to date from the transaction store's add/remove
+# events, so opening a report never walks the log. The totals are saved to
+# sales_snapshot.json together with the store's checkpoint(); on startup only
+# receipts appended after that point are folded in. When the totals have to
+# be rebuilt, closed periods come from their Z-reports (zreport.py) and only
+# receipts after the last close are read.
+
+SNAPSHOT_FILE = "sales_snapshot.json"
+SNAPSHOT_EVERY = 50         # save after this many changes (and on exit)
+
+
+def empty_totals():
+    return {
+        "count": 0,
+        "revenue": 0,
+        "days": {},         # "YYYY-MM-DD" -> revenue
+        "hours": {},        # "HH" -> revenue, across all days
+        "products": {},     # sku (or name, before SKUs) -> {"qty", "revenue", "name"}
+        "methods": {},      # "cash"/"card" -> {"count", "total"}
+        "cash_collected": 0,
+        "change_given": 0,
+    }
+
+
+def add_receipt(t, rec, sign=1):
+    # fold one receipt into (sign 1) or out of (sign -1) a totals dict
+    total = rec["total"] * sign
+    t["count"] += sign
+    t["revenue"] += total
+
+    day = rec["datetime"][:10]
+    hour = rec["datetime"][11:13]
+    t["days"][day] = t["days"].get(day, 0) + total
+    t["hours"][hour] = t["hours"].get(hour, 0) + total
+
+    for item in rec["items"]:
+        p = t["products"].setdefault(item.get("sku") or item["name"], {"qty": 0, "revenue": 0})
+        p["name"] = item["name"]
+        p["qty"] += item["qty"] * sign
+        p["revenue"] += item["total"] * sign
+
+    m = t["methods"].setdefault(rec["method"], {"count": 0, "total": 0})
+    m["count"] += sign
+    m["total"] += total
+    if rec["method"] == "cash":
+        t["cash_collected"] += rec["cash"] * sign
+        t["change_given"] += rec["change"] * sign
+
+
+def add_totals(t, other):
+    # add another totals dict (a closed day's, say) into t
+    for key in ("count", "revenue", "cash_collected", "change_given"):
+        t[key] += other[key]
+    for key in ("days", "hours"):
+        for k, v in other[key].items():
+            t[key][k] = t[key].get(k, 0) + v
+    for key, p in other["products"].items():
+        mine = t["products"].setdefault(key, {"qty": 0, "revenue": 0})
+        mine["name"] = p.get("name", key)
+        mine["qty"] += p["qty"]
+        mine["revenue"] += p["revenue"]
+    for method, m in other["methods"].items():
+        mine = t["methods"].setdefault(method, {"count": 0, "total": 0})
+        mine["count"] += m["count"]
+        mine["total"] += m["total"]
+
+
+def open_entries(store, after):
+    # entries of the receipts newer than `after` (a close time, "" for all)
+    if not after:
+        return store.live_entries()
+    return [e for e in store.search(start=after) if e[2] > after]
+
+
+class SalesReport:
+    def __init__(self, store, path=SNAPSHOT_FILE, catalog=None, closes=None):
+        self.store = store
+        self.path = path
+        self.catalog = catalog      # for current product names
+        self.closes = closes        # zreport.ZReports, to rebuild from
+        self.totals = empty_totals()
+        self.pending = 0
+
+        with store.lock:
+            if not self.load_snapshot():
+                self.rebuild()
+            store.subscribe(self.on_change)
+        atexit.register(self.save_snapshot)
+
+    # ---------- persistence ----------
+    def load_snapshot(self):
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "r") as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            return False
+        later = self.store.since(snap.get("checkpoint"))
+        if later is None:
+            return False        # something was deleted or rewritten since
+        self.totals = snap["totals"]
+        for rec in later:
+            self.apply(rec, 1)
+        return True
+
+    def save_snapshot(self):
+        with self.store.lock:
+            snap = {"checkpoint": self.store.checkpoint(), "totals": self.totals}
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(snap, f)
+            os.replace(tmp, self.path)
+            self.pending = 0
+
+    def rebuild(self):
+        self.totals = empty_totals()
+        if self.closes is not None and self.closes.last() is not None:
+            for z in self.closes.all():
+                add_totals(self.totals, z["totals"])
+            records = self.store.read_entries(open_entries(self.store, self.closes.sealed_through()))
+        else:
+            records = self.store.records()
+        for rec in records:
+            self.apply(rec, 1)
+        self.save_snapshot()
+
+    # ---------- updates ----------
+    def on_change(self, event, record):
+        if event == "rewrite":
+            self.rebuild()
+            return
+        if event == "compact":
+            self.save_snapshot()    # same totals; only the checkpoint moved
+            return
+        self.apply(record, 1 if event == "add" else -1)
+        self.pending += 1
+        if self.pending >= SNAPSHOT_EVERY:
+            self.save_snapshot()
+
+    def apply(self, rec, sign):
+        add_receipt(self.totals, rec, sign)
+
+    # ---------- display ----------
+    def products(self):
+        # totals per product under its current name; lines from before
+        # receipts carried SKUs are matched by any name the product had
+        merged = {}
+        if self.catalog is not None:
+            self.catalog.refresh()
+        for key, p in self.totals["products"].items():
+            if self.catalog is not None:
+                sku = key if key in self.catalog.products else self.catalog.past_names.get(key)
+                name = self.catalog.name_of(sku) if sku else key
+            else:
+                name = p.get("name", key)
+            m = merged.setdefault(name, {"qty": 0, "revenue": 0})
+            m["qty"] += p["qty"]
+            m["revenue"] += p["revenue"]
+        return merged
+
+    def lines(self, days=7, top=10):
+        self.store.refresh()    # fold in receipts from other terminals
+        t = self.totals
+        out = [f"Receipts: {t['count']}   Revenue: ₱{t['revenue']}", "", "Daily revenue:"]
+        for day in sorted(t["days"])[-days:]:
+            out.append(f"  {day}  ₱{t['days'][day]}")
+
+        out += ["", "Revenue by hour:"]
+        for hour in sorted(t["hours"]):
+            if t["hours"][hour]:
+                out.append(f"  {hour}:00  ₱{t['hours'][hour]}")
+
+        out += ["", f"Top {top} products:"]
+        ranked = sorted(self.products().items(), key=lambda kv: kv[1]["qty"], reverse=True)
+        for name, p in ranked[:top]:
+            if p["qty"]:
+                out.append(f"  {name} x{p['qty']} = ₱{p['revenue']}")
+
+        out += ["", "Payment methods:"]
+        for method, m in sorted(t["methods"].items()):
+            out.append(f"  {method}: {m['count']} receipts, ₱{m['total']}")
+        out.append(f"  Cash collected: ₱{t['cash_collected']}  Change given: ₱{t['change_given']}")
+        return out
@@ -0,0 +1,86 @@
+import os
+import sys
+import gzip
+import argparse
+import datetime
+
+from txstore import encode
+from storage import open_store
+
+# ==========================
+# RETENTION POLICY
+# ==========================
+# Receipts older than POS_RETENTION_DAYS are taken out of the store in one
+# purge (see storage.py), after being copied into a compressed file under
+# POS_ARCHIVE_DIR. The archive is written and fsynced before anything is
+# purged, so a crash in between leaves the receipts in both places and the
+# next run archives them again. An empty POS_ARCHIVE_DIR deletes them
+# without keeping a copy; POS_RETENTION_DAYS=0 (the default) keeps
+# everything.
+#
+#   python retention.py --days 365 [--archive archive] [--dry-run]
+
+RETENTION_DAYS = int(os.environ.get("POS_RETENTION_DAYS", "0"))
+ARCHIVE_DIR = os.environ.get("POS_ARCHIVE_DIR", "archive")
+
+
+def cutoff(days, now=None):
+    # receipts from before this date have expired
+    return str(((now or datetime.datetime.now()) - datetime.timedelta(days=days)).date())
+
+
+def expired(store, days):
+    if not days:
+        return []
+    entries = store.live_entries()
+    return entries[:store.find_date(cutoff(days), entries)]
+
+
+def archive(store, entries, directory=ARCHIVE_DIR):
+    # streams the receipts into <directory>/transactions-<first>_<last>.jsonl.gz
+    os.makedirs(directory, exist_ok=True)
+    name = f"transactions-{entries[0][2][:10]}_{entries[-1][2][:10]}.jsonl.gz"
+    path = os.path.join(directory, name)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as raw:
+        with gzip.open(raw, "wb") as f:
+            for rec in store.read_entries(entries):
+                f.write(encode(rec))
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+    return path
+
+
+def apply(store, days=RETENTION_DAYS, directory=ARCHIVE_DIR):
+    # (receipts purged, archive file or None); checkouts carry on meanwhile,
+    # they are never old enough to be caught
+    entries = expired(store, days)
+    if not entries:
+        return 0, None
+    path = archive(store, entries, directory) if directory else None
+    return store.purge(e[0] for e in entries), path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive and purge expired receipts")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS, help="keep this many days (0 = keep all)")
+    parser.add_argument("--archive", default=ARCHIVE_DIR, help="where to archive them ('' = don't)")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be purged")
+    parser.add_argument("--log", default=None, help="store path (default: the backend's usual file)")
+    args = parser.parse_args(argv)
+
+    store = open_store(path=args.log)
+    if args.dry_run:
+        entries = expired(store, args.days)
+        print(f"{len(entries)} receipts from before {cutoff(args.days)} would be purged" if args.days
+              else "Retention is off (--days 0)")
+    else:
+        count, path = apply(store, args.days, args.archive)
+        print(f"Purged {count} receipts" + (f", archived to {path}" if path else ""))
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
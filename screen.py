@@ -0,0 +1,115 @@
+import io
+import os
+import sys
+import shutil
+from contextlib import contextmanager, redirect_stdout
+
+import metrics
+
+# ==========================
+# SCREEN RENDERING
+# ==========================
+# Clears with ANSI escape codes instead of spawning cls/clear, and draws
+# frames differentially: a frame is captured from ordinary print() calls,
+# compared line by line with what is already on the terminal, and only the
+# changed lines (plus whatever was printed below the last frame) are
+# rewritten, all in a single write.
+#
+# Prompts, search results and messages printed under a frame are counted
+# (stdout and stdin go through thin wrappers that count lines); once more
+# than PROMPT_ROOM lines went below it the terminal may have scrolled, and
+# the next frame is drawn in full.
+
+HOME = "\033[H"
+CLEAR_ALL = "\033[2J"
+CLEAR_LINE = "\033[K"
+CLEAR_BELOW = "\033[J"
+PROMPT_ROOM = 5     # lines kept free under a frame for prompts and messages
+
+
+def enable_ansi():
+    # Windows 10+ consoles understand ANSI once virtual terminal mode is on
+    if os.name != "nt":
+        return
+    import ctypes
+    kernel32 = ctypes.windll.kernel32
+    handle = kernel32.GetStdHandle(-11)
+    mode = ctypes.c_uint32()
+    if kernel32.GetConsoleMode(handle, ctypes.byref(mode)):
+        kernel32.SetConsoleMode(handle, mode.value | 0x0004)
+
+
+def move_to(row):
+    return f"\033[{row};1H"
+
+
+class Counted:
+    # a stream that adds the lines passing through it to screen.below; no
+    # fileno(), so input() writes its prompt through sys.stdout as well
+    def __init__(self, screen, stream):
+        self.screen = screen
+        self.stream = stream
+
+    def write(self, text):
+        self.screen.below += text.count("\n")
+        return self.stream.write(text)
+
+    def readline(self, *args):
+        line = self.stream.readline(*args)
+        self.screen.below += 1      # the terminal echoed the Enter
+        return line
+
+    def fileno(self):
+        raise io.UnsupportedOperation("fileno")
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class Screen:
+    def __init__(self):
+        self.last = None    # lines of the frame on the terminal, None = unknown
+        self.below = 0      # lines printed or typed under it since
+        self.out = sys.stdout
+        sys.stdout = Counted(self, sys.stdout)
+        sys.stdin = Counted(self, sys.stdin)
+        enable_ansi()
+
+    def write(self, text):
+        self.out.write(text)
+        self.out.flush()
+
+    def clear(self):
+        with metrics.timer("screen.clear"):
+            self.write(HOME + CLEAR_ALL)
+        self.last = None
+        self.below = 0
+
+    @contextmanager
+    def frame(self):
+        buf = io.StringIO()
+        with redirect_stdout(buf):
+            yield
+        self.draw(buf.getvalue().rstrip("\n").split("\n"))
+
+    def draw(self, lines):
+        with metrics.timer("screen.draw") as t:
+            t.bytes = self.draw_lines(lines)
+
+    def draw_lines(self, lines):
+        rows = shutil.get_terminal_size().lines
+        if (self.last is None or self.below > PROMPT_ROOM
+                or max(len(lines), len(self.last)) + PROMPT_ROOM >= rows):
+            # unknown screen contents, or the terminal may have scrolled
+            parts = [HOME, CLEAR_ALL, "\n".join(lines), "\n"]
+        else:
+            parts = []
+            for row, line in enumerate(lines, start=1):
+                if row > len(self.last) or self.last[row - 1] != line:
+                    parts.append(move_to(row) + line + CLEAR_LINE)
+            parts.append(move_to(len(lines) + 1) + CLEAR_BELOW)
+        text = "".join(parts)
+        self.write(text)
+        self.last = lines
+        self.below = 0
+        return len(text)
@@ -0,0 +1,473 @@
+import os
+import sys
+import gzip
+import lzma
+import json
+import argparse
+import datetime
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+import metrics
+from txstore import TransactionStore, encode
+
+# ==========================
+# SEGMENTED TRANSACTION LOG
+# ==========================
+# Only the current period (a month by default) stays in transactions.json.
+# Older receipts are moved into one compressed segment per period under
+# transactions.json.segments/, listed in manifest.json with each segment's
+# first/last datetime and count. Next to every segment is a small plain-JSON
+# index of its entries, so listing, counting and date/method/amount searches
+# never decompress anything, and searches with a date range only look at the
+# segments that overlap it. A segment is decompressed when one of its
+# receipts is actually shown, and the last few opened are kept in memory.
+#
+# Rotation runs when the store is opened or an append notices the live log
+# still starts in an earlier period. Segments are written and the manifest
+# replaced before the live log is rewritten, so a crash in between leaves the
+# receipts in both places, and the next rotation merges them away again.
+#
+#   POS_STORAGE=segmented                     use it from the terminals
+#   python segments.py status | rotate        inspect or rotate by hand
+
+SEGMENT_SUFFIX = ".segments"
+MANIFEST_FILE = "manifest.json"
+PERIODS = {"month": 7, "day": 10}       # datetime prefix that names a segment
+SEGMENT_PERIOD = os.environ.get("POS_SEGMENT_PERIOD", "month")
+COMPRESSION = {"gzip": (gzip, ".jsonl.gz"), "lzma": (lzma, ".jsonl.xz")}
+SEGMENT_COMPRESSION = os.environ.get("POS_SEGMENT_COMPRESSION", "gzip")
+OPEN_SEGMENTS = 2       # decompressed segments kept for paging
+
+
+def narrow(found, start="", end="", method="", min_total=None, max_total=None):
+    if start:
+        found = found[bisect_left(found, start, key=lambda e: e[2]):]
+    if end:
+        # "2024-05-01" as an end date includes the whole day
+        found = found[:bisect_right(found, end, key=lambda e: e[2][:len(end)])]
+    if method:
+        found = [e for e in found if e[3] == method]
+    if min_total is not None:
+        found = [e for e in found if e[4] >= min_total]
+    if max_total is not None:
+        found = [e for e in found if e[4] <= max_total]
+    return found
+
+
+class SegmentedStore:
+    def __init__(self, path="transactions.json", period=SEGMENT_PERIOD, compression=SEGMENT_COMPRESSION):
+        self.live = TransactionStore(path)
+        self.lock = self.live.lock
+        self.dir = path + SEGMENT_SUFFIX
+        self.manifest_path = os.path.join(self.dir, MANIFEST_FILE)
+        self.width = PERIODS[period]
+        self.compression = compression
+        self.segments = []          # manifest entries, oldest period first
+        self.generation = 0         # bumped by every manifest change
+        self.stamp = None           # (mtime, size) of the manifest we loaded
+        self.indexes = {}           # period -> its entries, loaded on demand
+        self.index_ids = {}         # period -> {receipt_id: entry}
+        self.opened = OrderedDict() # period -> decompressed lines
+        self.listeners = []
+        self.rotator = None
+        os.makedirs(self.dir, exist_ok=True)
+        self.load_manifest()
+        if self.needs_rotation():
+            self.rotate()
+
+    def close(self):
+        if self.rotator is not None:
+            self.rotator.join()
+        self.live.close()
+
+    # ---------- manifest ----------
+    def manifest_stamp(self):
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def load_manifest(self):
+        self.stamp = self.manifest_stamp()
+        if self.stamp is None:
+            data = {}
+        else:
+            with open(self.manifest_path, "r") as f:
+                data = json.load(f)
+        self.segments = data.get("segments", [])
+        self.generation = data.get("generation", 0)
+        self.indexes = {}
+        self.index_ids = {}
+        self.opened.clear()
+
+    def save_manifest(self):
+        self.generation += 1
+        tmp = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"generation": self.generation, "segments": self.segments}, f, indent=1)
+        os.replace(tmp, self.manifest_path)
+        self.stamp = self.manifest_stamp()
+
+    def segment(self, period):
+        for seg in self.segments:
+            if seg["period"] == period:
+                return seg
+        return None
+
+    # ---------- change feed ----------
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+        self.live.subscribe(listener)
+
+    def notify(self, event, record):
+        for listener in self.listeners:
+            listener(event, record)
+
+    def refresh(self):
+        with self.lock:
+            changed = False
+            if self.manifest_stamp() != self.stamp:
+                # another terminal rotated or deleted from a segment
+                self.load_manifest()
+                self.notify("rewrite", None)
+                changed = True
+            return self.live.refresh() or changed
+
+    def checkpoint(self):
+        with self.lock:
+            return {"generation": self.generation, "live": self.live.checkpoint()}
+
+    def since(self, checkpoint):
+        with self.lock:
+            self.refresh()
+            if not checkpoint or checkpoint.get("generation") != self.generation:
+                return None
+            return self.live.since(checkpoint.get("live"))
+
+    # ---------- segments ----------
+    def file_of(self, seg, key="file"):
+        return os.path.join(self.dir, seg[key])
+
+    def segment_entries(self, seg):
+        period = seg["period"]
+        entries = self.indexes.get(period)
+        if entries is None:
+            with open(self.file_of(seg, "index"), "r") as f:
+                entries = [[rid, f"{period}:{n}", dt, method, total]
+                           for rid, n, dt, method, total in json.load(f)]
+            self.indexes[period] = entries
+            self.index_ids[period] = {e[0]: e for e in entries}
+        return entries
+
+    def segment_lines(self, period):
+        lines = self.opened.get(period)
+        if lines is not None:
+            self.opened.move_to_end(period)
+            return lines
+        seg = self.segment(period)
+        codec = COMPRESSION[seg.get("compression", "gzip")][0]
+        with metrics.timer("segment.open") as t:
+            with codec.open(self.file_of(seg), "rb") as f:
+                lines = f.read().splitlines()
+            t.bytes = seg["bytes"]
+        self.opened[period] = lines
+        while len(self.opened) > OPEN_SEGMENTS:
+            self.opened.popitem(last=False)
+        return lines
+
+    def segment_records(self, seg):
+        # stream a whole segment without keeping it around
+        codec = COMPRESSION[seg.get("compression", "gzip")][0]
+        with codec.open(self.file_of(seg), "rb") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def overlapping(self, start="", end=""):
+        return [seg for seg in self.segments
+                if (not start or seg["last"] >= start) and (not end or seg["first"][:len(end)] <= end)]
+
+    def cold_entries(self, start="", end=""):
+        found = []
+        for seg in self.overlapping(start, end):
+            found += self.segment_entries(seg)
+        return found
+
+    def write_segment(self, period, records, merge=True):
+        # merge into the existing segment for the period, dropping repeats
+        # a crash between archiving and rewriting the live log left behind
+        seg = self.segment(period)
+        if seg is not None and merge:
+            old = list(self.segment_records(seg))
+            seen = {r["receipt_id"] for r in old}
+            records = old + [r for r in records if r["receipt_id"] not in seen]
+        records.sort(key=lambda r: r["datetime"])
+        codec, suffix = COMPRESSION[self.compression]
+        name = period + suffix
+        index = []
+        raw = 0
+        tmp = os.path.join(self.dir, f"{name}.{os.getpid()}.tmp")
+        with codec.open(tmp, "wb") as f:
+            for n, rec in enumerate(records):
+                data = encode(rec)
+                f.write(data)
+                raw += len(data)
+                index.append([rec["receipt_id"], n, rec["datetime"], rec["method"], rec["total"]])
+        os.replace(tmp, os.path.join(self.dir, name))
+        index_name = period + ".idx.json"
+        tmp = os.path.join(self.dir, f"{index_name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(self.dir, index_name))
+
+        if seg is not None and seg["file"] != name:
+            os.remove(self.file_of(seg))
+        entry = {
+            "period": period,
+            "file": name,
+            "index": index_name,
+            "compression": self.compression,
+            "count": len(records),
+            "first": records[0]["datetime"] if records else "",
+            "last": records[-1]["datetime"] if records else "",
+            "raw_bytes": raw,
+            "bytes": os.path.getsize(os.path.join(self.dir, name))
+        }
+        self.segments = sorted([s for s in self.segments if s["period"] != period] + [entry],
+                               key=lambda s: s["period"])
+        self.forget(period)
+
+    def forget(self, period):
+        self.indexes.pop(period, None)
+        self.index_ids.pop(period, None)
+        self.opened.pop(period, None)
+
+    def drop_segment(self, seg):
+        for key in ("file", "index"):
+            try:
+                os.remove(self.file_of(seg, key))
+            except FileNotFoundError:
+                pass
+        self.segments = [s for s in self.segments if s["period"] != seg["period"]]
+        self.forget(seg["period"])
+
+    # ---------- rotation ----------
+    def current_period(self):
+        return str(datetime.datetime.now())[:self.width]
+
+    def needs_rotation(self):
+        entries = self.live.entries
+        return bool(entries) and entries[0][2][:self.width] < self.current_period()
+
+    def rotate(self):
+        with self.lock, self.live.file_lock:
+            self.refresh()
+            current = self.current_period()
+            older, keep = {}, []
+            for rec in self.live.records():
+                period = rec["datetime"][:self.width]
+                if period < current:
+                    older.setdefault(period, []).append(rec)
+                else:
+                    keep.append(rec)
+            if not older:
+                return 0
+            for period, records in sorted(older.items()):
+                self.write_segment(period, records)
+            self.save_manifest()
+            self.live.rewrite(keep)
+            return sum(len(r) for r in older.values())
+
+    def maybe_rotate(self):
+        if not self.needs_rotation():
+            return
+        if self.rotator is not None and self.rotator.is_alive():
+            return
+        self.rotator = threading.Thread(target=self.rotate, daemon=True)
+        self.rotator.start()
+
+    # ---------- reads ----------
+    def get(self, receipt_id):
+        rec = self.live.get(receipt_id)
+        if rec is not None:
+            return rec
+        with self.lock:
+            self.refresh()
+            for seg in reversed(self.segments):
+                self.segment_entries(seg)
+                entry = self.index_ids[seg["period"]].get(receipt_id)
+                if entry is not None:
+                    return next(self.read_entries([entry]))
+        return None
+
+    def live_entries(self, refresh=True):
+        with self.lock:
+            if refresh:
+                self.refresh()
+            return self.cold_entries() + self.live.live_entries(refresh=False)
+
+    def current_entry(self, entry):
+        # a cold entry names a line of its segment, and that line moves when
+        # the segment is rewritten (a delete or purge, here or on another
+        # terminal); map it onto the current index by receipt_id, or None
+        # once the receipt is gone
+        period = entry[1].rsplit(":", 1)[0]
+        seg = self.segment(period)
+        if seg is None:
+            return None
+        self.segment_entries(seg)
+        return self.index_ids[period].get(entry[0])
+
+    def read_entries(self, entries):
+        with self.lock:
+            self.refresh()
+            generation = self.generation
+        batch = []      # consecutive entries from the live log
+        for entry in entries:
+            if isinstance(entry[1], str):
+                if batch:
+                    yield from self.live.read_entries(batch)
+                    batch = []
+                with self.lock:
+                    if self.generation != generation or self.manifest_stamp() != self.stamp:
+                        self.refresh()
+                        generation = self.generation
+                    entry = self.current_entry(entry)
+                    if entry is None:
+                        continue
+                    period, n = entry[1].rsplit(":", 1)
+                    line = self.segment_lines(period)[int(n)]
+                yield json.loads(line)
+            else:
+                batch.append(entry)
+        if batch:
+            yield from self.live.read_entries(batch)
+
+    def records(self):
+        for seg in list(self.segments):
+            yield from self.segment_records(seg)
+        yield from self.live.records()
+
+    def page(self, start, count, entries=None):
+        if entries is None:
+            entries = self.live_entries()
+        return self.read_entries(entries[start:start + count])
+
+    def find_date(self, when, entries=None):
+        if entries is None:
+            with self.lock:
+                self.refresh()
+                cold = self.cold_entries()
+                return (bisect_left(cold, when, key=lambda e: e[2])
+                        + self.live.find_date(when, self.live.live_entries(refresh=False)))
+        return bisect_left(entries, when, key=lambda e: e[2])
+
+    def search(self, prefix="", start="", end="", method="", min_total=None, max_total=None):
+        with self.lock:
+            self.refresh()
+            cold = self.cold_entries(start, end)
+        if prefix:
+            cold = [e for e in cold if e[0].startswith(prefix)]
+        return (narrow(cold, start, end, method, min_total, max_total)
+                + self.live.search(prefix, start, end, method, min_total, max_total))
+
+    def __len__(self):
+        with self.lock:
+            self.refresh()
+            return sum(seg["count"] for seg in self.segments) + len(self.live)
+
+    # ---------- writes ----------
+    def append(self, record):
+        self.live.append(record)
+        self.maybe_rotate()
+
+    def append_many(self, records):
+        self.live.append_many(records)
+        self.maybe_rotate()
+
+    def delete(self, receipt_id):
+        if self.live.delete(receipt_id):
+            return True
+        with self.lock, self.live.file_lock:
+            self.refresh()
+            for seg in self.segments:
+                self.segment_entries(seg)
+                if receipt_id in self.index_ids[seg["period"]]:
+                    records = list(self.segment_records(seg))
+                    rec = next(r for r in records if r["receipt_id"] == receipt_id)
+                    rest = [r for r in records if r["receipt_id"] != receipt_id]
+                    if rest:
+                        self.write_segment(seg["period"], rest, merge=False)
+                    else:
+                        self.drop_segment(seg)
+                    self.save_manifest()
+                    self.notify("remove", rec)
+                    return True
+        return False
+
+    def purge(self, receipt_ids):
+        # each segment holding any of them is rewritten once; the live log
+        # gets its own single pass
+        drop = set(receipt_ids)
+        with self.lock, self.live.file_lock:
+            self.refresh()
+            cold = 0
+            for seg in list(self.segments):
+                hit = drop.intersection(e[0] for e in self.segment_entries(seg))
+                if not hit:
+                    continue
+                rest = [r for r in self.segment_records(seg) if r["receipt_id"] not in hit]
+                if rest:
+                    self.write_segment(seg["period"], rest, merge=False)
+                else:
+                    self.drop_segment(seg)
+                cold += len(hit)
+            if cold:
+                self.save_manifest()
+            hot = self.live.purge(drop)
+            if cold and not hot:
+                self.notify("rewrite", None)
+            return cold + hot
+
+    def rewrite(self, records):
+        with self.lock, self.live.file_lock:
+            self.refresh()
+            for seg in list(self.segments):
+                self.drop_segment(seg)
+            self.save_manifest()
+            self.live.rewrite(records)
+            self.rotate()
+
+    def compact(self):
+        self.live.compact()
+
+
+# ==========================
+# COMMAND LINE
+# ==========================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Segmented transaction log tools")
+    parser.add_argument("command", choices=["status", "rotate"])
+    parser.add_argument("--log", default="transactions.json")
+    args = parser.parse_args(argv)
+
+    store = SegmentedStore(args.log)
+    if args.command == "rotate":
+        print(f"Archived {store.rotate()} receipts")
+    raw = packed = 0
+    for seg in store.segments:
+        raw += seg["raw_bytes"]
+        packed += seg["bytes"]
+        print(f"{seg['period']}  {seg['count']:>8} receipts  {seg['raw_bytes']:>12} -> {seg['bytes']:>10} bytes  "
+              f"{seg['first']} .. {seg['last']}")
+    print(f"live  {len(store.live):>8} receipts  {os.path.getsize(args.log):>12} bytes")
+    if raw:
+        print(f"segments compressed {raw} -> {packed} bytes ({packed / raw:.1%})")
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+import sys
+import json
+import socket
+import asyncio
+import argparse
+import itertools
+import traceback
+
+from pos_core import POS, POSError
+
+# ==========================
+# POS SERVER
+# ==========================
+# One process owns the catalog, the open carts and the transaction store, and
+# any number of terminals talk to it over TCP or a Unix socket. Requests and
+# replies are JSON lines:
+#
+#   -> {"id": 1, "op": "add_item", "args": {"cart": 3, "code": "2", "qty": 1}}
+#   <- {"id": 1, "ok": true, "result": {...}}
+#   <- {"id": 1, "ok": false, "error": "Unknown product code '9'!"}
+#
+# History queries are answered from the store's in-memory index (only the
+# receipts on the requested page are read from the log). Every operation that
+# can touch a file (the catalog, the stock ledger, the store, the Z-reports)
+# runs in a worker thread, so one slow disk never stalls the other terminals,
+# and appends from many terminals arriving together land in the store's group
+# commit and share one fsync.
+#
+#   python server.py --port 8765          or   python server.py --unix pos.sock
+
+HOST = "127.0.0.1"
+PORT = 8765
+# the receipt history is only shown to admins on the terminals, so it is here too
+ADMIN_OPS = {"update_product", "delete_transaction", "purge_transactions", "apply_retention", "report_lines",
+             "receive_stock", "count_stock", "preview_close", "close_day", "zreports",
+             "transaction_count", "list_transactions", "find_date", "search_transactions", "get_transaction"}
+
+
+def error_reply(request, message):
+    return {"id": request.get("id") if isinstance(request, dict) else None, "ok": False, "error": message}
+
+
+def cart_view(cart_id, cart):
+    return {
+        "cart": cart_id,
+        "items": [dict(line.as_dict(), sku=line.sku) for line in cart],
+        "total": cart.total
+    }
+
+
+class Session:
+    def __init__(self):
+        self.user = None
+        self.carts = {}     # cart id -> Cart, dropped with the connection
+
+
+class POSServer:
+    def __init__(self, pos=None):
+        self.pos = pos or POS()
+        self.cart_ids = itertools.count(1)
+        self.clients = 0
+
+    # ---------- connections ----------
+    async def handle(self, reader, writer):
+        session = Session()
+        self.clients += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = None
+                try:
+                    request = json.loads(line)
+                    result = await self.dispatch(session, request.get("op"), request.get("args") or {})
+                    reply = {"id": request.get("id"), "ok": True, "result": result}
+                except (POSError, KeyError, TypeError, ValueError) as e:
+                    reply = error_reply(request, str(e))
+                except Exception as e:
+                    # a bug or a failing disk: tell the terminal and keep its session and carts
+                    traceback.print_exc()
+                    reply = error_reply(request, f"{type(e).__name__}: {e}")
+                writer.write((json.dumps(reply) + "\n").encode("utf-8"))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    async def dispatch(self, session, op, args):
+        if op == "login":
+            session.user = self.pos.login(args["user"], args["password"])
+            if session.user is None:
+                raise POSError("Invalid credentials!")
+            return session.user
+        if session.user is None:
+            raise POSError("Not logged in!")
+        if op in ADMIN_OPS and session.user != "admin":
+            raise POSError("Admins only!")
+        handler = getattr(self, "op_" + str(op), None)
+        if handler is None:
+            raise POSError(f"Unknown operation {op!r}!")
+        return await handler(session, **args)
+
+    def cart(self, session, cart_id):
+        cart = session.carts.get(cart_id)
+        if cart is None:
+            raise POSError("No such cart!")
+        return cart
+
+    # ---------- catalog ----------
+    async def op_products(self, session, count=10):
+        products = await asyncio.to_thread(self.pos.products, count)
+        return {"products": products, "count": await asyncio.to_thread(self.pos.product_count)}
+
+    async def op_lookup_product(self, session, code):
+        return await asyncio.to_thread(self.pos.lookup_product, code)
+
+    async def op_search_products(self, session, prefix, limit=10):
+        return await asyncio.to_thread(self.pos.search_products, prefix, limit)
+
+    async def op_update_product(self, session, sku, name=None, price=None):
+        await asyncio.to_thread(self.pos.update_product, sku, name, price)
+        return await asyncio.to_thread(self.pos.lookup_product, sku)
+
+    # ---------- carts ----------
+    async def op_new_cart(self, session):
+        cart_id = next(self.cart_ids)
+        session.carts[cart_id] = self.pos.new_cart()
+        return cart_view(cart_id, session.carts[cart_id])
+
+    async def op_cart(self, session, cart):
+        return cart_view(cart, self.cart(session, cart))
+
+    async def op_add_item(self, session, cart, code, qty=1):
+        await asyncio.to_thread(self.pos.add_item, self.cart(session, cart), code, qty)
+        return cart_view(cart, session.carts[cart])
+
+    async def op_set_qty(self, session, cart, sku, qty):
+        c = self.cart(session, cart)
+        if sku not in c:
+            raise POSError("Item not in cart!")
+        c.set_qty(sku, qty)
+        return cart_view(cart, c)
+
+    async def op_void_cart(self, session, cart):
+        self.cart(session, cart).void()
+        return cart_view(cart, session.carts[cart])
+
+    async def op_checkout(self, session, cart, method, cash=None):
+        c = self.cart(session, cart)
+        return await asyncio.to_thread(self.pos.checkout, c, method, cash)
+
+    # ---------- stock ----------
+    async def op_stock_level(self, session, sku):
+        return await asyncio.to_thread(self.pos.stock_level, sku)
+
+    async def op_low_stock(self, session):
+        low = await asyncio.to_thread(self.pos.low_stock)
+        return [{"sku": p["sku"], "name": p["name"], "left": left} for p, left in low]
+
+    async def op_receive_stock(self, session, sku, qty):
+        return await asyncio.to_thread(self.pos.receive_stock, sku, qty)
+
+    async def op_count_stock(self, session, sku, qty):
+        return await asyncio.to_thread(self.pos.count_stock, sku, qty)
+
+    # ---------- history ----------
+    async def op_transaction_count(self, session):
+        return await asyncio.to_thread(len, self.pos.store)
+
+    async def op_list_transactions(self, session, start=0, count=10):
+        return await asyncio.to_thread(self.pos.list_transactions, start, count)
+
+    async def op_find_date(self, session, when):
+        return await asyncio.to_thread(self.pos.find_date, when)
+
+    async def op_search_transactions(self, session, **filters):
+        return await asyncio.to_thread(self.pos.search_transactions, **filters)
+
+    async def op_get_transaction(self, session, receipt_id):
+        return await asyncio.to_thread(self.pos.get_transaction, receipt_id)
+
+    async def op_delete_transaction(self, session, receipt_id):
+        return await asyncio.to_thread(self.pos.delete_transaction, receipt_id)
+
+    async def op_purge_transactions(self, session, receipt_ids):
+        return await asyncio.to_thread(self.pos.purge_transactions, receipt_ids)
+
+    async def op_apply_retention(self, session, days=None):
+        return await asyncio.to_thread(self.pos.apply_retention, days)
+
+    async def op_report_lines(self, session):
+        return await asyncio.to_thread(self.pos.report_lines)
+
+    async def op_preview_close(self, session):
+        return await asyncio.to_thread(self.pos.preview_close)
+
+    async def op_close_day(self, session):
+        return await asyncio.to_thread(self.pos.close_day, session.user)
+
+    async def op_zreports(self, session):
+        return await asyncio.to_thread(self.pos.zreports)
+
+    # ---------- startup ----------
+    async def serve(self, host=HOST, port=PORT, unix=None):
+        self.pos.store    # open the store (and index the log) before accepting anyone
+        if unix:
+            server = await asyncio.start_unix_server(self.handle, path=unix)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+# ==========================
+# CLIENT
+# ==========================
+class Client:
+    # blocking client for terminals and scripts:
+    #   c = Client(); c.login(user="cashier", password="1234")
+    #   cart = c.new_cart()["cart"]; c.add_item(cart=cart, code="2", qty=1)
+    def __init__(self, host=HOST, port=PORT, unix=None):
+        if unix:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(unix)
+        else:
+            self.sock = socket.create_connection((host, port))
+        self.file = self.sock.makefile("rwb")
+        self.ids = itertools.count(1)
+
+    def call(self, op, **args):
+        request_id = next(self.ids)
+        self.file.write((json.dumps({"id": request_id, "op": op, "args": args}) + "\n").encode("utf-8"))
+        self.file.flush()
+        reply = json.loads(self.file.readline())
+        if not reply["ok"]:
+            raise POSError(reply["error"])
+        return reply["result"]
+
+    def __getattr__(self, op):
+        return lambda **args: self.call(op, **args)
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve one shared POS to many terminals")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--unix", default=None, help="listen on this Unix socket instead of TCP")
+    args = parser.parse_args(argv)
+
+    where = args.unix or f"{args.host}:{args.port}"
+    print(f"POS server listening on {where}")
+    try:
+        asyncio.run(POSServer().serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
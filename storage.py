@@ -0,0 +1,370 @@
+import os
+import sys
+import atexit
+import sqlite3
+import argparse
+import threading
+from bisect import bisect_left
+
+from txstore import TransactionStore
+from segments import SegmentedStore
+
+# ==========================
+# STORAGE BACKENDS
+# ==========================
+# The POS talks to its transaction store through one set of methods:
+#
+#   append(record)  append_many(records)  delete(receipt_id)  purge(receipt_ids)
+#   get(receipt_id)  rewrite(records)  records()  live_entries()
+#   read_entries(entries)  page(start, count, entries)  find_date(when, entries)
+#   search(...)  len(store)  refresh()  compact()  subscribe(listener)
+#   checkpoint()  since(checkpoint)  close()
+#
+# where an "entry" is [receipt_id, position, datetime, method, total].
+# append_many() writes a batch as one transaction / one fsync. purge()
+# removes many receipts at once, in one pass and all or nothing, and tells
+# subscribers with a single "rewrite"; a compaction that only dropped dead
+# lines sends "compact" instead, which leaves totals as they are.
+#
+# TransactionStore (JSON lines, txstore.py), SegmentedStore (the same log
+# with older periods archived as compressed segments, segments.py) and
+# SqliteStore below all provide them; POS_STORAGE=segmented or
+# POS_STORAGE=sqlite picks one of the others.
+
+SQLITE_FILE = "transactions.db"
+MIGRATE_BATCH = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS receipts (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    receipt_id TEXT NOT NULL UNIQUE,
+    datetime TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    method TEXT NOT NULL,
+    cash INTEGER NOT NULL,
+    change INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS receipts_datetime ON receipts (datetime);
+CREATE TABLE IF NOT EXISTS items (
+    receipt_seq INTEGER NOT NULL REFERENCES receipts (seq) ON DELETE CASCADE,
+    line INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    qty INTEGER NOT NULL,
+    price INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    sku TEXT,
+    version INTEGER,
+    PRIMARY KEY (receipt_seq, line)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('deletes', 0);
+"""
+
+INSERT_RECEIPT = ("INSERT OR IGNORE INTO receipts (receipt_id, datetime, total, method, cash, change) "
+                  "VALUES (?, ?, ?, ?, ?, ?)")
+INSERT_ITEM = ("INSERT INTO items (receipt_seq, line, name, qty, price, total, sku, version) "
+               "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+SELECT_RECEIPT = "SELECT seq, receipt_id, datetime, total, method, cash, change FROM receipts"
+SELECT_ENTRY = "SELECT receipt_id, seq, datetime, method, total FROM receipts"
+SELECT_ITEMS = "SELECT receipt_seq, name, qty, price, total, sku, version FROM items"
+
+
+def make_record(row, items):
+    seq, receipt_id, dt, total, method, cash, change = row
+    return {
+        "receipt_id": receipt_id,
+        "datetime": dt,
+        "items": items,
+        "total": total,
+        "method": method,
+        "cash": cash,
+        "change": change
+    }
+
+
+def make_item(row):
+    item = {"name": row[1], "qty": row[2], "price": row[3], "total": row[4]}
+    if row[5] is not None:
+        item["sku"] = row[5]
+        item["version"] = row[6]
+    return item
+
+
+class SqliteStore:
+    def __init__(self, path=SQLITE_FILE):
+        self.path = path
+        self.lock = threading.RLock()
+        self.listeners = []
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=FULL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(SCHEMA)
+        if "sku" not in {row[1] for row in self.db.execute("PRAGMA table_info(items)")}:
+            # databases from before items recorded the catalog version
+            self.db.execute("ALTER TABLE items ADD COLUMN sku TEXT")
+            self.db.execute("ALTER TABLE items ADD COLUMN version INTEGER")
+        self.seen_seq, self.seen_deletes = self.position()
+        atexit.register(self.close)
+
+    def position(self):
+        seq = self.db.execute("SELECT COALESCE(MAX(seq), 0) FROM receipts").fetchone()[0]
+        deletes = self.db.execute("SELECT value FROM meta WHERE key = 'deletes'").fetchone()[0]
+        return seq, deletes
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    # ---------- change feed ----------
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def notify(self, event, record):
+        for listener in self.listeners:
+            listener(event, record)
+
+    def refresh(self):
+        # pass on what this or any other terminal changed since last time
+        with self.lock:
+            seq, deletes = self.position()
+            if deletes != self.seen_deletes:
+                self.seen_seq, self.seen_deletes = seq, deletes
+                self.notify("rewrite", None)
+                return True
+            if seq == self.seen_seq:
+                return False
+            if self.listeners:
+                for rec in self.fetch("WHERE seq > ? ORDER BY seq", (self.seen_seq,)):
+                    self.notify("add", rec)
+            self.seen_seq = seq
+            return True
+
+    def checkpoint(self):
+        with self.lock:
+            seq, deletes = self.position()
+            return {"seq": seq, "deletes": deletes}
+
+    def since(self, checkpoint):
+        with self.lock:
+            seq, deletes = self.position()
+            if not checkpoint or checkpoint.get("deletes") != deletes or checkpoint.get("seq", 0) > seq:
+                return None
+            return list(self.fetch("WHERE seq > ? ORDER BY seq", (checkpoint["seq"],)))
+
+    # ---------- reads ----------
+    def fetch(self, where="", params=()):
+        # the receipts matching `where`, each with its items
+        with self.lock:
+            rows = self.db.execute(f"{SELECT_RECEIPT} {where}", params).fetchall()
+            if not rows:
+                return []
+            seqs = [r[0] for r in rows]
+            items = {}
+            for i in range(0, len(seqs), 500):
+                chunk = seqs[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                for row in self.db.execute(
+                        f"{SELECT_ITEMS} WHERE receipt_seq IN ({marks}) ORDER BY receipt_seq, line", chunk):
+                    items.setdefault(row[0], []).append(make_item(row))
+        return [make_record(r, items.get(r[0], [])) for r in rows]
+
+    def records(self):
+        with self.lock:
+            # stream both tables in seq order and zip items onto receipts
+            receipts = self.db.execute(f"{SELECT_RECEIPT} ORDER BY seq")
+            items = self.db.execute(f"{SELECT_ITEMS} ORDER BY receipt_seq, line")
+            item = items.fetchone()
+            for row in receipts:
+                lines = []
+                while item is not None and item[0] <= row[0]:
+                    if item[0] == row[0]:
+                        lines.append(make_item(item))
+                    item = items.fetchone()
+                yield make_record(row, lines)
+
+    def get(self, receipt_id):
+        found = self.fetch("WHERE receipt_id = ?", (receipt_id,))
+        return found[0] if found else None
+
+    def live_entries(self, refresh=True):
+        with self.lock:
+            return [list(r) for r in self.db.execute(f"{SELECT_ENTRY} ORDER BY seq")]
+
+    def read_entries(self, entries):
+        seqs = [e[1] for e in entries]
+        if not seqs:
+            return iter([])
+        marks = ",".join("?" * len(seqs))
+        found = {r["receipt_id"]: r for r in self.fetch(f"WHERE seq IN ({marks})", seqs)}
+        return iter([found[e[0]] for e in entries if e[0] in found])
+
+    def page(self, start, count, entries=None):
+        if entries is not None:
+            return self.read_entries(entries[start:start + count])
+        return iter(self.fetch("ORDER BY seq LIMIT ? OFFSET ?", (count, start)))
+
+    def find_date(self, when, entries=None):
+        if entries is not None:
+            return bisect_left(entries, when, key=lambda e: e[2])
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM receipts WHERE datetime < ?", (when,)).fetchone()[0]
+
+    def search(self, prefix="", start="", end="", method="", min_total=None, max_total=None):
+        where, params = [], []
+        if prefix:
+            where.append("receipt_id >= ? AND receipt_id < ?")
+            params += [prefix, prefix + "\uffff"]
+        if start:
+            where.append("datetime >= ?")
+            params.append(start)
+        if end:
+            # "2024-05-01" as an end date includes the whole day
+            where.append("substr(datetime, 1, ?) <= ?")
+            params += [len(end), end]
+        if method:
+            where.append("method = ?")
+            params.append(method)
+        if min_total is not None:
+            where.append("total >= ?")
+            params.append(min_total)
+        if max_total is not None:
+            where.append("total <= ?")
+            params.append(max_total)
+        clause = ("WHERE " + " AND ".join(where)) if where else ""
+        with self.lock:
+            return [list(r) for r in self.db.execute(f"{SELECT_ENTRY} {clause} ORDER BY seq", params)]
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM receipts").fetchone()[0]
+
+    # ---------- writes ----------
+    def insert(self, records):
+        # how many were new; receipt_ids already stored are skipped
+        inserted = 0
+        for rec in records:
+            cur = self.db.execute(INSERT_RECEIPT, (rec["receipt_id"], rec["datetime"], rec["total"],
+                                                   rec["method"], rec["cash"], rec["change"]))
+            if cur.rowcount:
+                inserted += 1
+                seq = cur.lastrowid
+                self.db.executemany(INSERT_ITEM, [(seq, n, i["name"], i["qty"], i["price"], i["total"],
+                                                   i.get("sku"), i.get("version"))
+                                                  for n, i in enumerate(rec["items"])])
+        return inserted
+
+    def append(self, record):
+        with self.lock:
+            with self.db:
+                self.db.execute("BEGIN IMMEDIATE")
+                self.insert([record])
+            self.refresh()
+
+    def append_many(self, records):
+        with self.lock:
+            with self.db:
+                self.db.execute("BEGIN IMMEDIATE")
+                self.insert(records)
+            self.refresh()
+
+    def delete(self, receipt_id):
+        with self.lock:
+            rec = self.get(receipt_id)
+            if rec is None:
+                return False
+            self.refresh()
+            with self.db:
+                self.db.execute("BEGIN IMMEDIATE")
+                self.db.execute("DELETE FROM receipts WHERE receipt_id = ?", (receipt_id,))
+                self.db.execute("UPDATE meta SET value = value + 1 WHERE key = 'deletes'")
+            if self.position()[1] == self.seen_deletes + 1:
+                self.seen_deletes += 1
+                self.notify("remove", rec)
+            return True
+
+    def purge(self, receipt_ids):
+        ids = list(set(receipt_ids))
+        removed = 0
+        with self.lock:
+            with self.db:
+                self.db.execute("BEGIN IMMEDIATE")
+                for i in range(0, len(ids), 500):
+                    chunk = ids[i:i + 500]
+                    marks = ",".join("?" * len(chunk))
+                    removed += self.db.execute(f"DELETE FROM receipts WHERE receipt_id IN ({marks})",
+                                               chunk).rowcount
+                if removed:
+                    self.db.execute("UPDATE meta SET value = value + 1 WHERE key = 'deletes'")
+            self.refresh()
+        return removed
+
+    def rewrite(self, records):
+        with self.lock:
+            with self.db:
+                self.db.execute("BEGIN IMMEDIATE")
+                self.db.execute("DELETE FROM receipts")
+                self.db.execute("UPDATE meta SET value = value + 1 WHERE key = 'deletes'")
+                self.insert(records)
+            self.refresh()
+
+    def compact(self):
+        with self.lock:
+            self.db.execute("VACUUM")
+
+
+def open_store(kind=None, path=None):
+    kind = kind or os.environ.get("POS_STORAGE", "json")
+    if kind == "sqlite":
+        return SqliteStore(path or os.environ.get("POS_SQLITE_FILE", SQLITE_FILE))
+    if kind == "segmented":
+        return SegmentedStore(path or "transactions.json")
+    return TransactionStore(path or "transactions.json")
+
+
+# ==========================
+# MIGRATION
+# ==========================
+def migrate(log="transactions.json", db=SQLITE_FILE, batch=MIGRATE_BATCH):
+    # safe to re-run: receipts already in the database are skipped
+    source = TransactionStore(log)
+    target = SqliteStore(db)
+    moved = 0
+    pending = []
+    for rec in source.records():
+        pending.append(rec)
+        if len(pending) >= batch:
+            moved += flush(target, pending)
+            pending = []
+    moved += flush(target, pending)
+    target.close()
+    return moved
+
+
+def flush(target, records):
+    if not records:
+        return 0
+    with target.lock, target.db:
+        target.db.execute("BEGIN IMMEDIATE")
+        return target.insert(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Storage backend tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    m = sub.add_parser("migrate", help="import transactions.json into SQLite")
+    m.add_argument("--log", default="transactions.json")
+    m.add_argument("--db", default=SQLITE_FILE)
+    m.add_argument("--batch", type=int, default=MIGRATE_BATCH)
+    args = parser.parse_args(argv)
+
+    moved = migrate(args.log, args.db, args.batch)
+    print(f"Imported {moved} receipts from {args.log} into {args.db}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import uuid
+import queue
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+
+from txstore import TransactionStore
+
+TIMEOUT = 300       # seconds the whole run may take
+POLL = 1            # seconds between checks on the workers while waiting
+
+# ==========================
+# MULTI-TERMINAL STRESS TEST
+# ==========================
+# Several cashier processes append receipts to one log while an admin process
+# keeps deleting receipts and compacting the file underneath them. At the end
+# every receipt a cashier saved and the admin didn't delete must be there,
+# exactly once. A worker that dies, or a run that takes longer than
+# --timeout, is a failure too.
+#
+#   python stress_test.py --cashiers 8 --receipts 500
+
+
+def cashier(path, count, results):
+    store = TransactionStore(path)
+    saved = []
+    for _ in range(count):
+        receipt_id = str(uuid.uuid4())
+        qty = random.randint(1, 5)
+        store.append({
+            "receipt_id": receipt_id,
+            "datetime": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "items": [{"name": "Logo", "qty": qty, "price": 50, "total": qty * 50}],
+            "total": qty * 50,
+            "method": "card",
+            "cash": qty * 50,
+            "change": 0
+        })
+        saved.append(receipt_id)
+    store.close()
+    results.put(("cashier", saved))
+
+
+def admin(path, stop, results):
+    store = TransactionStore(path)
+    deleted = []
+    while not stop.is_set():
+        live = store.live_entries()
+        if live:
+            receipt_id = random.choice(live)[0]
+            if store.delete(receipt_id):
+                deleted.append(receipt_id)
+        if random.random() < 0.05:
+            store.compact()
+        time.sleep(0.002)
+    store.close()
+    results.put(("admin", deleted))
+
+
+def collect(results, procs, count, deadline):
+    # `count` results off the queue, or None once a worker has died or time is up
+    got = []
+    while len(got) < count:
+        try:
+            got.append(results.get(timeout=POLL))
+        except queue.Empty:
+            if any(p.exitcode not in (None, 0) for p in procs) or time.monotonic() > deadline:
+                return None
+    return got
+
+
+def raw_receipts(path):
+    # read the log without the index, applying tombstones by hand
+    live = {}
+    with open(path, "r") as f:
+        for line in f:
+            rec = json.loads(line)
+            if rec.get("deleted"):
+                live.pop(rec["receipt_id"], None)
+            else:
+                live[rec["receipt_id"]] = live.get(rec["receipt_id"], 0) + 1
+    return live
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hammer one transaction log from many processes")
+    parser.add_argument("--cashiers", type=int, default=4)
+    parser.add_argument("--receipts", type=int, default=300, help="receipts per cashier")
+    parser.add_argument("--dir", default=None, help="where to put the log (default: a temp dir)")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT, help="seconds before giving up")
+    args = parser.parse_args(argv)
+
+    workdir = args.dir or tempfile.mkdtemp(prefix="pos-stress-")
+    os.makedirs(workdir, exist_ok=True)
+    path = os.path.join(workdir, "transactions.json")
+    results = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+
+    start = time.perf_counter()
+    deadline = time.monotonic() + args.timeout
+    cashiers = [multiprocessing.Process(target=cashier, args=(path, args.receipts, results), name=f"cashier-{n}")
+                for n in range(args.cashiers)]
+    admin_proc = multiprocessing.Process(target=admin, args=(path, stop, results), name="admin")
+    procs = cashiers + [admin_proc]
+    admin_proc.start()
+    for p in cashiers:
+        p.start()
+
+    # results are drained before joining: a child can't exit with its result
+    # still unflushed in the queue
+    done = collect(results, procs, len(cashiers), deadline)
+    stop.set()
+    last = collect(results, procs, 1, deadline) if done is not None else None
+    hung = []
+    for p in procs:
+        p.join(max(deadline - time.monotonic(), POLL))
+        if p.is_alive():
+            hung.append(p)
+            p.terminate()
+            p.join()
+    elapsed = time.perf_counter() - start
+
+    problems = [f"{p.name} still running after {args.timeout:.0f}s" for p in hung]
+    problems += [f"{p.name} exited with code {p.exitcode}" for p in procs if p not in hung and p.exitcode != 0]
+    if problems or done is None or last is None:
+        for p in problems:
+            print("FAIL: " + p)
+        return 1
+    saved = {rid for kind, ids in done for rid in ids}
+    deleted = last[0][1]
+
+    expected = saved - set(deleted)
+    indexed = [r["receipt_id"] for r in TransactionStore(path).records()]
+    raw = raw_receipts(path)
+
+    print(f"Log: {path}")
+    print(f"Saved {len(saved)} receipts from {args.cashiers} cashiers in {elapsed:.2f}s "
+          f"({len(saved) / elapsed:.0f}/s), admin deleted {len(deleted)}")
+    if set(indexed) != expected or len(indexed) != len(expected):
+        problems.append(f"indexed view has {len(indexed)} receipts, expected {len(expected)}")
+    if set(raw) != expected:
+        problems.append(f"raw log has {len(raw)} live receipts, expected {len(expected)}")
+    if any(n > 1 for n in raw.values()):
+        problems.append("some receipts were written twice")
+    for p in problems:
+        print("FAIL: " + p)
+    if not problems:
+        print("OK: no lost or duplicated receipts")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
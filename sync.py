@@ -0,0 +1,295 @@
+import os
+import sys
+import gzip
+import json
+import time
+import socket
+import asyncio
+import argparse
+import datetime
+import threading
+
+import metrics
+from txstore import encode
+from storage import open_store
+from reports import SalesReport
+
+# ==========================
+# TERMINAL -> CENTRAL SYNC
+# ==========================
+# Every till keeps writing its own local store, online or not; a Syncer ships
+# what is new to the central store in gzip batches whenever it can reach it.
+#
+#   -> {"op": "push", "terminal": "till-2", "count": 500, "bytes": 18234}\n<gzip of JSON lines>
+#   <- {"ok": true, "accepted": 498, "duplicates": 2}
+#   -> {"op": "status"}
+#   <- {"ok": true, "terminals": {"till-2": {"receipts": .., "batches": .., "last_seen": ..}}}
+#
+# The central side keeps every receipt_id it has, so a batch that is sent
+# twice (the ack got lost, the till crashed) is simply skipped the second
+# time. The till's cursor (sync_cursor.json) holds the store checkpoint() it
+# has fully sent plus how many receipts after it were acked, and is saved
+# after every batch, so an interrupted sync resumes at the next batch. When
+# the local log was rewritten since (a compaction, a purge), since() can't
+# answer and the receipts from SYNC_OVERLAP seconds before the newest one
+# sent are offered again; the dedup drops the repeats.
+#
+# Only receipts travel; deletes stay on the till.
+#
+#   python sync.py central [--port 8766] [--dir central]     the stand-in
+#   python sync.py push [--central host:port]                one pass, e.g. from cron
+#   python sync.py status [--central host:port]
+#   python sync.py report [--dir central]                    head-office sales report
+#
+# With POS_CENTRAL=host:port set, the terminals sync in the background as
+# soon as they open their store, after each checkout and every SYNC_INTERVAL
+# seconds.
+
+CENTRAL = os.environ.get("POS_CENTRAL", "")
+CENTRAL_PORT = 8766
+CENTRAL_DIR = "central"
+TERMINAL = os.environ.get("POS_TERMINAL") or socket.gethostname()
+CURSOR_FILE = "sync_cursor.json"
+SYNC_BATCH = 500            # receipts per push
+SYNC_INTERVAL = 30          # seconds between background attempts
+SYNC_OVERLAP = 60           # seconds re-offered after a local rewrite
+SYNC_TIMEOUT = 10
+
+
+def address(central):
+    host, _, port = central.rpartition(":")
+    return host or "127.0.0.1", int(port or CENTRAL_PORT)
+
+
+# ==========================
+# TERMINAL SIDE
+# ==========================
+class Syncer:
+    def __init__(self, store, central=CENTRAL, terminal=TERMINAL, cursor_path=CURSOR_FILE):
+        self.store = store
+        self.central = central
+        self.terminal = terminal
+        self.cursor_path = cursor_path
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.last_error = None
+        self.last_sync = None
+
+    # ---------- cursor ----------
+    def load_cursor(self):
+        fresh = {"checkpoint": None, "acked": 0, "through": ""}
+        try:
+            with open(self.cursor_path, "r") as f:
+                cursor = json.load(f)
+        except (OSError, ValueError):
+            return fresh
+        # a cursor missing fields (hand-edited, older) starts over; the dedup drops repeats
+        return cursor if isinstance(cursor, dict) and cursor.keys() >= fresh.keys() else fresh
+
+    def save_cursor(self, cursor):
+        tmp = f"{self.cursor_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(cursor, f)
+        os.replace(tmp, self.cursor_path)
+
+    def pending(self, cursor):
+        # (checkpoint the list starts from or None, receipts not yet acked)
+        newer = self.store.since(cursor["checkpoint"]) if cursor["checkpoint"] else None
+        if newer is not None:
+            return cursor["checkpoint"], newer[cursor["acked"]:]
+        if not cursor["through"]:
+            return None, list(self.store.records())
+        start = datetime.datetime.fromisoformat(cursor["through"]) - datetime.timedelta(seconds=SYNC_OVERLAP)
+        return None, list(self.store.read_entries(self.store.search(start=str(start))))
+
+    # ---------- pushing ----------
+    def connect(self):
+        sock = socket.create_connection(address(self.central), timeout=SYNC_TIMEOUT)
+        return sock, sock.makefile("rwb")
+
+    def push(self, f, records):
+        with metrics.timer("sync.push") as t:
+            data = gzip.compress(b"".join(encode(r) for r in records))
+            header = {"op": "push", "terminal": self.terminal, "count": len(records), "bytes": len(data)}
+            f.write((json.dumps(header) + "\n").encode("utf-8") + data)
+            f.flush()
+            reply = json.loads(f.readline() or b"null")
+            t.bytes = len(data)
+        if not reply or not reply.get("ok"):
+            raise OSError(f"central refused the batch: {reply and reply.get('error')}")
+        return reply
+
+    def sync(self):
+        # one pass; returns how many receipts central accepted
+        with self.lock:
+            self.store.refresh()
+            checkpoint = self.store.checkpoint()
+            cursor = self.load_cursor()
+            base, records = self.pending(cursor)
+            acked = cursor["acked"] if base is not None else 0
+            accepted = 0
+            if records:
+                sock, f = self.connect()
+                try:
+                    for i in range(0, len(records), SYNC_BATCH):
+                        batch = records[i:i + SYNC_BATCH]
+                        accepted += self.push(f, batch)["accepted"]
+                        acked += len(batch)
+                        through = max([cursor["through"]] + [r["datetime"] for r in batch])
+                        cursor = {"checkpoint": base, "acked": acked if base else 0, "through": through}
+                        self.save_cursor(cursor)
+                finally:
+                    f.close()
+                    sock.close()
+            # everything up to the checkpoint taken before reading is on central
+            self.save_cursor({"checkpoint": checkpoint, "acked": 0, "through": cursor["through"]})
+            self.last_sync = str(datetime.datetime.now())
+            self.last_error = None
+            return accepted
+
+    # ---------- background ----------
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def poke(self):
+        # a checkout happened: sync soon rather than at the next interval
+        self.start()
+        self.wake.set()
+
+    def run(self):
+        while True:
+            self.wake.wait(SYNC_INTERVAL)
+            self.wake.clear()
+            try:
+                self.sync()
+            except Exception as e:
+                # offline, or anything else: keep the thread, try again later
+                self.last_error = f"{type(e).__name__}: {e}"
+
+
+# ==========================
+# CENTRAL STAND-IN
+# ==========================
+class Central:
+    def __init__(self, directory=CENTRAL_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.store = open_store("json", os.path.join(directory, "transactions.json"))
+        self.ids = {e[0] for e in self.store.live_entries()}
+        self.terminals_path = os.path.join(directory, "terminals.json")
+        try:
+            with open(self.terminals_path, "r") as f:
+                self.terminals = json.load(f)
+        except (OSError, ValueError):
+            self.terminals = {}
+        self.write_lock = asyncio.Lock()
+
+    def save_terminals(self):
+        tmp = self.terminals_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.terminals, f, indent=1)
+        os.replace(tmp, self.terminals_path)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if request.get("op") == "push":
+                        data = await reader.readexactly(request["bytes"])
+                        reply = await self.receive(request["terminal"], data)
+                    elif request.get("op") == "status":
+                        reply = {"terminals": self.terminals, "receipts": len(self.ids)}
+                    else:
+                        raise ValueError(f"Unknown operation {request.get('op')!r}!")
+                    reply["ok"] = True
+                except (KeyError, TypeError, ValueError, OSError) as e:
+                    reply = {"ok": False, "error": str(e)}
+                writer.write((json.dumps(reply) + "\n").encode("utf-8"))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def receive(self, terminal, data):
+        records = [json.loads(line) for line in gzip.decompress(data).splitlines() if line.strip()]
+        async with self.write_lock:
+            fresh = []
+            seen = set()        # only joins self.ids once the batch is on disk
+            for rec in records:
+                rid = rec["receipt_id"]
+                if rid not in self.ids and rid not in seen:
+                    seen.add(rid)
+                    fresh.append(dict(rec, terminal=terminal))
+            # a failed write leaves self.ids untouched, so the retry is accepted
+            await asyncio.to_thread(self.store.append_many, fresh)
+            self.ids |= seen
+            stats = self.terminals.setdefault(terminal, {"receipts": 0, "batches": 0, "last_seen": ""})
+            stats["receipts"] += len(fresh)
+            stats["batches"] += 1
+            stats["last_seen"] = str(datetime.datetime.now())
+            self.save_terminals()
+        return {"accepted": len(fresh), "duplicates": len(records) - len(fresh)}
+
+    async def serve(self, host="127.0.0.1", port=CENTRAL_PORT):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync terminals to a central store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    c = sub.add_parser("central", help="run the central stand-in")
+    c.add_argument("--host", default="127.0.0.1")
+    c.add_argument("--port", type=int, default=CENTRAL_PORT)
+    c.add_argument("--dir", default=CENTRAL_DIR)
+    for name, text in (("push", "send this terminal's new receipts"), ("status", "what central has")):
+        p = sub.add_parser(name, help=text)
+        p.add_argument("--central", default=CENTRAL or f"127.0.0.1:{CENTRAL_PORT}")
+    r = sub.add_parser("report", help="sales report over every terminal's receipts")
+    r.add_argument("--dir", default=CENTRAL_DIR)
+    args = parser.parse_args(argv)
+
+    if args.command == "central":
+        print(f"Central store in {args.dir}/ listening on {args.host}:{args.port}")
+        try:
+            asyncio.run(Central(args.dir).serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    elif args.command == "push":
+        store = open_store()
+        start = time.perf_counter()
+        try:
+            accepted = Syncer(store, args.central).sync()
+        except OSError as e:
+            print(f"Central at {args.central} unreachable, will resume from the cursor: {e}")
+            return 1
+        finally:
+            store.close()
+        print(f"Central accepted {accepted} receipts in {time.perf_counter() - start:.2f}s")
+    elif args.command == "report":
+        store = open_store("json", os.path.join(args.dir, "transactions.json"))
+        for line in SalesReport(store, os.path.join(args.dir, "sales_snapshot.json")).lines():
+            print(line)
+        store.close()
+    else:
+        with socket.create_connection(address(args.central), timeout=SYNC_TIMEOUT) as sock:
+            f = sock.makefile("rwb")
+            f.write(b'{"op": "status"}\n')
+            f.flush()
+            reply = json.loads(f.readline())
+        print(f"Central holds {reply['receipts']} receipts")
+        for name, t in sorted(reply["terminals"].items()):
+            print(f"  {name:<20} {t['receipts']:>8} receipts in {t['batches']:>5} batches, last seen {t['last_seen']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,589 @@
+import os
+import json
+import time
+import atexit
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+import metrics
+import mmlog
+
+# ==========================
+# TRANSACTION STORE
+# ==========================
+# transactions.json stays a JSON-lines file, but it is only ever appended to.
+# A receipt_id -> byte offset index is kept next to it (transactions.json.idx)
+# so one receipt can be read with a single seek, and deletes are written as
+# tombstone lines that a background compaction later drops for good.
+#
+# Each index entry also carries the receipt's datetime, method and total, so
+# searches by date range, method or amount never have to open the log.
+#
+# Anything that keeps derived state (reports, ...) can subscribe() and gets
+# ("add", record), ("remove", record) or ("rewrite", None) for every change,
+# including receipts another terminal appended that we pick up from the tail,
+# and ("compact", None) when only dead lines were dropped and the live
+# receipts are the same ones at new offsets.
+#
+# Writes are group-committed: the log handle stays open, appends arriving
+# within GROUP_COMMIT_WINDOW seconds of each other go out as one write + one
+# fsync, and append() only returns once its receipt is on disk. A torn last
+# line left by a crash mid-write is cut off when the store is opened.
+#
+# Several terminals may share one log. Every write, rewrite and compaction
+# holds an exclusive lock on transactions.json.lock, and each process notices
+# appends (by size) and rewrites (by inode) made by the others before it
+# writes or reads, so nobody's receipts are lost or read at stale offsets.
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 2
+COMPACT_MIN_DEAD = 100      # don't bother compacting tiny logs
+COMPACT_RATIO = 0.3         # compact when this share of lines is dead
+GROUP_COMMIT_WINDOW = 0.002 # seconds a commit waits for more appends to join
+MMAP_SCAN_MIN = 1 << 20     # index tails this big from the mapped file
+LOCK_SUFFIX = ".lock"
+# Windows can't replace a file another process holds open, so there the
+# append handle is closed after each commit to let other terminals compact
+KEEP_LOG_OPEN = os.name != "nt"
+
+if os.name == "nt":
+    import msvcrt
+
+    def lock_file(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                time.sleep(0.01)
+
+    def unlock_file(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def lock_file(fd):
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def unlock_file(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def encode(record):
+    return (json.dumps(record) + "\n").encode("utf-8")
+
+
+def file_identity(st):
+    return [st.st_dev, st.st_ino]
+
+
+class FileLock:
+    # exclusive lock shared between processes; re-entrant within one
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self.depth = 0
+        self.mutex = threading.RLock()
+
+    def __enter__(self):
+        self.mutex.acquire()
+        if self.depth == 0:
+            if self.fd is None:
+                self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+            lock_file(self.fd)
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if self.depth == 0:
+            unlock_file(self.fd)
+        self.mutex.release()
+
+
+class TransactionStore:
+    def __init__(self, path="transactions.json", commit_window=GROUP_COMMIT_WINDOW):
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        self.lock = threading.RLock()
+        self.file_lock = FileLock(path + LOCK_SUFFIX)
+        self.identity = None    # [st_dev, st_ino] of the indexed log
+        self.by_id = {}         # receipt_id -> its live entry
+        self.ids = []           # sorted receipt_ids, for prefix search
+        self.entries = []       # [receipt_id, offset, datetime, method, total]
+        self.dead = 0           # tombstones + records they shadow
+        self.size = 0           # bytes of the log already indexed
+        self.compactor = None
+        self.listeners = []
+
+        self.log = None         # append handle, kept open between commits
+        self.commit_window = commit_window
+        self.commit_cond = threading.Condition()
+        self.queue = []         # encoded lines waiting for the next commit
+        self.enqueued = 0       # tickets handed out to appenders
+        self.committed = 0      # highest ticket known to be on disk
+        self.flushing = False   # a leader is collecting/writing a group
+        self.failed = None      # (first, last, error) of the last failed group
+
+        with self.file_lock:
+            if not os.path.exists(path):
+                open(path, "w").close()
+            self.recover()
+        self.identity = file_identity(os.stat(path))
+        if not self.load_index():
+            self.reset_index()
+        if self.index_tail():
+            self.save_index()
+        atexit.register(self.close)
+
+    def recover(self):
+        # drop a partially written last line left behind by a crash;
+        # callers hold the file lock so no live writer is mid-line
+        with open(self.path, "rb+") as f:
+            end = f.seek(0, os.SEEK_END)
+            pos = end
+            while pos > 0:
+                step = min(65536, pos)
+                f.seek(pos - step)
+                chunk = f.read(step)
+                if pos == end and chunk.endswith(b"\n"):
+                    return False
+                cut = chunk.rfind(b"\n")
+                if cut != -1:
+                    f.truncate(pos - step + cut + 1)
+                    return True
+                pos -= step
+            f.truncate(0)
+            return True
+
+    def close(self):
+        with self.lock:
+            self.close_log()
+            self.save_index()
+        atexit.unregister(self.close)   # saved already; the files may be gone by exit
+
+    # ---------- index ----------
+    def reset_index(self):
+        self.by_id = {}
+        self.ids = []
+        self.entries = []
+        self.dead = 0
+        self.size = 0
+
+    def load_index(self):
+        if not os.path.exists(self.index_path):
+            return False
+        try:
+            with open(self.index_path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get("version") != INDEX_VERSION or data.get("identity") != self.identity:
+            return False
+        if data.get("size", 0) > os.path.getsize(self.path):
+            return False        # log was truncated or replaced behind our back
+        self.entries = data.get("entries", [])
+        self.by_id = {e[0]: e for e in self.entries}
+        self.ids = sorted(self.by_id)
+        self.dead = data.get("dead", 0)
+        self.size = data.get("size", 0)
+        if self.entries:
+            rid, off = self.entries[-1][:2]
+            rec = self.read_at(off)
+            if rec is None or rec.get("receipt_id") != rid:
+                self.reset_index()
+        return True
+
+    def save_index(self):
+        with self.lock:
+            data = {
+                "version": INDEX_VERSION,
+                "identity": self.identity,
+                "size": self.size,
+                "dead": self.dead,
+                "entries": self.live_entries(refresh=False),
+            }
+            tmp = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                f.write(json.dumps(data))   # one C-encoded string, not json.dump's chunks
+            os.replace(tmp, self.index_path)
+
+    def index_line(self, line, offset):
+        line = line.strip()
+        if not line:
+            return
+        rec = json.loads(line)
+        self.index_fields(offset, rec.get("receipt_id"), rec.get("datetime", ""), rec.get("method"),
+                          rec.get("total", 0), rec.get("deleted"), rec)
+
+    def index_fields(self, offset, rid, dt, method, total, deleted, rec=None, sort=True):
+        # sort=False leaves self.ids for the caller to rebuild once at the end
+        if deleted:
+            entry = self.by_id.pop(rid, None)
+            if entry is not None:
+                if sort:
+                    self.ids.pop(bisect_left(self.ids, rid))
+                self.dead += 1
+                if self.listeners:
+                    self.notify("remove", self.read_at(entry[1]))
+            self.dead += 1
+            return
+        if rid in self.by_id:
+            self.dead += 1
+        elif sort:
+            insort(self.ids, rid)
+        entry = [rid, offset, dt, method, total]
+        self.by_id[rid] = entry
+        self.entries.append(entry)
+        self.notify("add", rec)
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def notify(self, event, record):
+        for listener in self.listeners:
+            listener(event, record)
+
+    def index_tail(self):
+        # picks up anything appended since the index was last saved
+        with self.lock:
+            size = os.path.getsize(self.path)
+            if size <= self.size:
+                return False
+            if not self.listeners and size - self.size >= MMAP_SCAN_MIN:
+                # nobody needs whole records: only slice out the indexed fields
+                with metrics.timer("log.scan") as t:
+                    end = self.size
+                    for offset, length, found in mmlog.scan(self.path, self.size):
+                        if found is not None:
+                            self.index_fields(offset, *found, sort=False)
+                        end = offset + length
+                    self.ids = sorted(self.by_id)
+                    t.bytes = end - self.size
+                self.size = end
+                return True
+            with open(self.path, "rb") as f:
+                f.seek(self.size)
+                offset = self.size
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    self.index_line(line, offset)
+                    offset += len(line)
+            self.size = offset
+            return True
+
+    def reindex(self):
+        # the log was rewritten (by us or another terminal): index it afresh
+        # without replaying every record to listeners, then tell them once
+        with self.lock:
+            listeners, self.listeners = self.listeners, []
+            try:
+                self.reset_index()
+                self.identity = file_identity(os.stat(self.path))
+                self.index_tail()
+            finally:
+                self.listeners = listeners
+            self.notify("rewrite", None)
+
+    def refresh(self):
+        with self.lock:
+            st = os.stat(self.path)
+            if file_identity(st) != self.identity or st.st_size < self.size:
+                self.reindex()
+                return True
+            return self.index_tail()
+
+    # ---------- reads ----------
+    def read_at(self, offset):
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            line = f.readline()
+        if not line.strip():
+            return None
+        return json.loads(line)
+
+    def get(self, receipt_id):
+        with self.lock:
+            entry = self.by_id.get(receipt_id)
+        if entry is None:
+            return None
+        return self.read_at(entry[1])
+
+    def live_entries(self, refresh=True):
+        with self.lock:
+            if refresh:
+                self.refresh()
+            return [e for e in self.entries if self.by_id.get(e[0]) is e]
+
+    def read_entries(self, entries):
+        with open(self.path, "rb") as f:
+            if file_identity(os.fstat(f.fileno())) != self.identity:
+                # rewritten since these entries were handed out; map them
+                # onto the new index by receipt_id
+                self.refresh()
+                with self.lock:
+                    entries = [self.by_id[e[0]] for e in entries if e[0] in self.by_id]
+                if file_identity(os.fstat(f.fileno())) != self.identity:
+                    yield from self.read_entries(entries)
+                    return
+            for entry in entries:
+                f.seek(entry[1])
+                yield json.loads(f.readline())
+
+    def records(self):
+        return self.read_entries(self.live_entries())
+
+    def page(self, start, count, entries=None):
+        # only the records on screen are read from disk
+        if entries is None:
+            entries = self.live_entries()
+        return self.read_entries(entries[start:start + count])
+
+    def find_date(self, when, entries=None):
+        # receipts are appended in time order, so the entries are date sorted
+        if entries is None:
+            entries = self.live_entries()
+        return bisect_left(entries, when, key=lambda e: e[2])
+
+    def search(self, prefix="", start="", end="", method="", min_total=None, max_total=None):
+        if prefix:
+            with self.lock:
+                self.refresh()
+                lo = bisect_left(self.ids, prefix)
+                hi = bisect_left(self.ids, prefix + "\uffff")
+                found = sorted((self.by_id[rid] for rid in self.ids[lo:hi]), key=lambda e: e[1])
+        else:
+            found = self.live_entries()
+        if start:
+            found = found[bisect_left(found, start, key=lambda e: e[2]):]
+        if end:
+            # "2024-05-01" as an end date includes the whole day
+            found = found[:bisect_right(found, end, key=lambda e: e[2][:len(end)])]
+        if method:
+            found = [e for e in found if e[3] == method]
+        if min_total is not None:
+            found = [e for e in found if e[4] >= min_total]
+        if max_total is not None:
+            found = [e for e in found if e[4] <= max_total]
+        return found
+
+    def __len__(self):
+        with self.lock:
+            self.refresh()
+            return len(self.by_id)
+
+    def checkpoint(self):
+        with self.lock:
+            return {"identity": self.identity, "size": self.size, "dead": self.dead}
+
+    def since(self, checkpoint):
+        # receipts appended after checkpoint(), or None when anything older
+        # was deleted or rewritten and derived state has to start over
+        with self.lock:
+            if (not checkpoint or checkpoint.get("identity") != self.identity
+                    or checkpoint.get("dead") != self.dead or checkpoint.get("size", 0) > self.size):
+                return None
+            later = [e for e in self.live_entries(refresh=False) if e[1] >= checkpoint["size"]]
+        return list(self.read_entries(later))
+
+    # ---------- writes ----------
+    def close_log(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+    def write_batch(self, batch):
+        with self.lock, self.file_lock:
+            # another terminal may have appended or compacted meanwhile
+            self.refresh()
+            if self.log is not None and file_identity(os.fstat(self.log.fileno())) != self.identity:
+                self.close_log()
+            if self.log is None:
+                self.log = open(self.path, "ab")
+            if os.fstat(self.log.fileno()).st_size != self.size:
+                self.recover()      # torn line from a terminal that crashed
+            try:
+                with metrics.timer("log.write") as t:
+                    data = b"".join(batch)
+                    self.log.write(data)
+                    self.log.flush()
+                    t.bytes = len(data)
+                with metrics.timer("log.fsync"):
+                    os.fsync(self.log.fileno())
+            except BaseException:
+                # none of the group may survive a failed write or fsync, or
+                # the next refresh() would index receipts their cashiers
+                # were told failed
+                self.abandon_batch()
+                raise
+            if not KEEP_LOG_OPEN:
+                self.close_log()
+            # index only once the group is durable, so readers never see
+            # an offset whose line isn't there yet
+            for data in batch:
+                self.index_line(data, self.size)
+                self.size += len(data)
+
+    def abandon_batch(self):
+        # called with the file lock held, so nobody else has appended since
+        try:
+            self.close_log()
+        except OSError:
+            self.log = None     # the buffered bytes are going anyway
+        os.truncate(self.path, self.size)
+
+    def commit(self, data):
+        with self.commit_cond:
+            self.queue.append(data)
+            self.enqueued += 1
+            ticket = self.enqueued
+            while self.flushing and self.committed < ticket:
+                self.commit_cond.wait()
+            if self.committed >= ticket:
+                if self.failed and self.failed[0] <= ticket <= self.failed[1]:
+                    raise self.failed[2]
+                return
+            self.flushing = True
+
+        # this caller leads the group: give others a moment to join it
+        if self.commit_window:
+            time.sleep(self.commit_window)
+        with self.commit_cond:
+            batch, self.queue = self.queue, []
+            first, last = self.committed + 1, self.enqueued
+        try:
+            self.write_batch(batch)
+        except Exception as e:
+            self.failed = (first, last, e)
+            raise
+        finally:
+            with self.commit_cond:
+                self.committed = last
+                self.flushing = False
+                self.commit_cond.notify_all()
+
+    def append(self, record):
+        self.commit(encode(record))
+
+    def append_many(self, records):
+        # a whole batch as one write + fsync, without waiting on the group commit
+        if records:
+            self.write_batch([encode(r) for r in records])
+
+    def delete(self, receipt_id):
+        if receipt_id not in self.by_id:
+            return False
+        self.commit(encode({"receipt_id": receipt_id, "deleted": True}))
+        self.maybe_compact()
+        return True
+
+    def rewrite(self, records):
+        with self.lock, self.file_lock:
+            self.close_log()
+            tmp = self.path + ".tmp"
+            self.reset_index()
+            listeners, self.listeners = self.listeners, []
+            offset = 0
+            try:
+                with metrics.timer("log.rewrite") as t, open(tmp, "wb") as f:
+                    for rec in records:
+                        data = encode(rec)
+                        f.write(data)
+                        self.index_line(data, offset)
+                        offset += len(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    t.bytes = offset
+                os.replace(tmp, self.path)
+            finally:
+                self.listeners = listeners
+            self.identity = file_identity(os.stat(self.path))
+            self.size = offset
+            self.save_index()
+            self.notify("rewrite", None)
+
+    # ---------- compaction ----------
+    def needs_compaction(self):
+        total = len(self.by_id) + self.dead
+        return self.dead >= COMPACT_MIN_DEAD and self.dead > total * COMPACT_RATIO
+
+    def compact(self):
+        self.purge()
+
+    def purge(self, receipt_ids=()):
+        # drops these receipts, along with tombstones and superseded lines, in
+        # one sequential copy of the log that replaces it once it is on disk.
+        # The log as it was at the start is copied without holding the locks,
+        # so checkouts carry on meanwhile; only what was appended since is
+        # copied under them, right before the swap
+        drop = set(receipt_ids)
+        with self.lock, self.file_lock:
+            self.refresh()
+            keep = {e[1]: e for e in self.live_entries(refresh=False) if e[0] not in drop}
+            removed = len(self.by_id) - len(keep)
+            if not removed and not self.dead:
+                return 0
+            identity, upto = self.identity, self.size
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with metrics.timer("log.purge") as t, open(self.path, "rb") as src, open(tmp, "wb") as f:
+                if file_identity(os.fstat(src.fileno())) != identity:
+                    return 0        # rewritten by another terminal already
+                entries = []
+                offset = 0
+                pos = 0
+                for line in src:
+                    if pos >= upto:
+                        break
+                    entry = keep.get(pos)
+                    pos += len(line)
+                    if entry is not None:
+                        f.write(line)
+                        entries.append([entry[0], offset] + entry[2:])
+                        offset += len(line)
+                with self.lock, self.file_lock:
+                    self.refresh()
+                    if self.identity != identity:
+                        return 0    # another terminal's rewrite won; ours is stale
+                    src.seek(upto)
+                    tail = src.read(self.size - upto)
+                    f.write(tail)
+                    f.flush()
+                    os.fsync(f.fileno())
+                    t.bytes = offset + len(tail)
+                    self.close_log()
+                    os.replace(tmp, self.path)
+                    self.swap_index(entries, offset)
+                    self.save_index()
+                    # dropping dead lines leaves the receipts as they were
+                    self.notify("rewrite" if removed else "compact", None)
+                    return removed
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def swap_index(self, entries, size):
+        # index of the purged copy: `entries` cover its first `size` bytes,
+        # the tail after them was indexed (and announced) before the swap
+        listeners, self.listeners = self.listeners, []
+        try:
+            self.entries = entries
+            self.by_id = {e[0]: e for e in entries}
+            self.ids = sorted(self.by_id)
+            self.dead = 0
+            self.size = size
+            self.identity = file_identity(os.stat(self.path))
+            self.index_tail()
+        finally:
+            self.listeners = listeners
+
+    def maybe_compact(self):
+        if not self.needs_compaction():
+            return
+        if self.compactor is not None and self.compactor.is_alive():
+            return
+        self.compactor = threading.Thread(target=self.compact, daemon=True)
+        self.compactor.start()
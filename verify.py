@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# ==========================
+# PARALLEL LOG VERIFIER
+# ==========================
+# Splits transactions.json at line boundaries into chunks, parses and checks
+# them in a process pool, and merges what each chunk found:
+#
+#   - live receipts, tombstones and per-day revenue
+#   - receipt_ids written more than once
+#   - total == sum of item totals, item total == qty * price,
+#     change == cash - total, and lines that don't parse at all
+#
+# Revenue only counts receipts that weren't deleted. Tombstones are rare (the
+# log is compacted), so when there are any, a second parallel pass looks up
+# the day and total of just the deleted receipts and takes them back out.
+#
+#   python verify.py --log transactions.json --jobs 8 [--json]
+
+CHUNKS_PER_JOB = 4
+MAX_PROBLEMS = 20       # examples kept per kind of problem
+
+
+def chunk_bounds(path, count):
+    # byte ranges that start and end on line boundaries
+    size = os.path.getsize(path)
+    cuts = [0]
+    with open(path, "rb") as f:
+        for n in range(1, count):
+            f.seek(max(size * n // count, cuts[-1]))
+            if f.tell() > 0:
+                f.readline()
+            cuts.append(min(f.tell(), size))
+    cuts.append(size)
+    return [(a, b) for a, b in zip(cuts, cuts[1:]) if b > a]
+
+
+def id_bytes(receipt_id):
+    try:
+        return uuid.UUID(receipt_id).bytes
+    except (ValueError, AttributeError, TypeError):
+        return None
+
+
+def problem(found, kind, offset, receipt_id, detail):
+    examples = found["problems"].setdefault(kind, [0, []])
+    examples[0] += 1
+    if len(examples[1]) < MAX_PROBLEMS:
+        examples[1].append({"offset": offset, "receipt_id": receipt_id, "detail": detail})
+
+
+def scan_chunk(args):
+    path, start, end = args
+    found = {
+        "lines": 0,
+        "receipts": 0,
+        "tombstones": [],
+        "days": {},
+        "ids": bytearray(),     # 16-byte UUIDs, concatenated
+        "other_ids": [],        # receipt_ids that aren't UUIDs
+        "problems": {}
+    }
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        for line in f:
+            if offset >= end:
+                break
+            here = offset
+            offset += len(line)
+            if not line.strip():
+                continue
+            found["lines"] += 1
+            try:
+                rec = json.loads(line)
+                rid = rec["receipt_id"]
+                if rec.get("deleted"):
+                    found["tombstones"].append(rid)
+                    continue
+                items = rec["items"]
+                total = rec["total"]
+                day = rec["datetime"][:10]
+                cash, change = rec["cash"], rec["change"]
+            except (ValueError, KeyError, TypeError) as e:
+                problem(found, "unreadable", here, None, f"{type(e).__name__}: {e}")
+                continue
+
+            found["receipts"] += 1
+            found["days"][day] = found["days"].get(day, 0) + total
+            raw = id_bytes(rid)
+            if raw is None:
+                found["other_ids"].append(rid)
+            else:
+                found["ids"] += raw
+            try:
+                if sum(i["total"] for i in items) != total:
+                    problem(found, "total_mismatch", here, rid,
+                            f"total {total} but items add up to {sum(i['total'] for i in items)}")
+                for i in items:
+                    if i["qty"] * i["price"] != i["total"]:
+                        problem(found, "item_mismatch", here, rid,
+                                f"{i['name']}: {i['qty']} x {i['price']} != {i['total']}")
+            except (KeyError, TypeError) as e:
+                problem(found, "unreadable", here, rid, f"bad items: {e}")
+            if change != cash - total:
+                problem(found, "change_mismatch", here, rid, f"change {change} but cash {cash} - total {total}")
+    found["ids"] = bytes(found["ids"])
+    return found
+
+
+def find_deleted(args):
+    # (receipt_id, day, total) of receipts in this chunk that were deleted
+    path, start, end, deleted = args
+    out = []
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        for line in f:
+            if offset >= end:
+                break
+            offset += len(line)
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if not rec.get("deleted") and rec.get("receipt_id") in deleted:
+                out.append((rec["receipt_id"], rec["datetime"][:10], rec["total"]))
+    return out
+
+
+def merge(parts):
+    result = {"lines": 0, "receipts": 0, "tombstones": 0, "days": {}, "problems": {}}
+    seen = set()
+    duplicates = []
+    for part in parts:
+        result["lines"] += part["lines"]
+        result["receipts"] += part["receipts"]
+        result["tombstones"] += len(part["tombstones"])
+        for day, total in part["days"].items():
+            result["days"][day] = result["days"].get(day, 0) + total
+        ids = part["ids"]
+        for n in range(0, len(ids), 16):
+            raw = ids[n:n + 16]
+            if raw in seen:
+                duplicates.append(str(uuid.UUID(bytes=raw)))
+            seen.add(raw)
+        for rid in part["other_ids"]:
+            if rid in seen:
+                duplicates.append(rid)
+            seen.add(rid)
+        for kind, (count, examples) in part["problems"].items():
+            mine = result["problems"].setdefault(kind, [0, []])
+            mine[0] += count
+            mine[1] += examples[:MAX_PROBLEMS - len(mine[1])]
+    if duplicates:
+        result["problems"]["duplicate_id"] = [len(duplicates),
+                                             [{"receipt_id": rid} for rid in duplicates[:MAX_PROBLEMS]]]
+    return result
+
+
+def verify(path="transactions.json", jobs=None):
+    if not jobs:
+        jobs = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    chunks = chunk_bounds(path, jobs * CHUNKS_PER_JOB)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(jobs) as pool:
+        parts = list(pool.map(scan_chunk, [(path, a, b) for a, b in chunks]))
+        result = merge(parts)
+        deleted = {rid for part in parts for rid in part["tombstones"]}
+        if deleted:
+            for found in pool.map(find_deleted, [(path, a, b, deleted) for a, b in chunks]):
+                for rid, day, total in found:
+                    result["receipts"] -= 1
+                    result["days"][day] -= total
+                    deleted.discard(rid)
+    result["live"] = result.pop("receipts")
+    result["revenue"] = sum(result["days"].values())
+    result["chunks"] = len(chunks)
+    result["jobs"] = jobs
+    result["bytes"] = os.path.getsize(path)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check transactions.json in parallel")
+    parser.add_argument("--log", default="transactions.json")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--json", action="store_true", help="print the full result as JSON")
+    args = parser.parse_args(argv)
+
+    result = verify(args.log, args.jobs)
+    if args.json:
+        print(json.dumps(result, indent=1))
+    else:
+        print(f"{args.log}: {result['bytes']} bytes, {result['lines']} lines in {result['chunks']} chunks "
+              f"on {result['jobs']} processes, {result['seconds']:.2f}s")
+        print(f"Live receipts: {result['live']}  Tombstones: {result['tombstones']}  "
+              f"Revenue: ₱{result['revenue']}  Days: {len(result['days'])}")
+        for kind, (count, examples) in sorted(result["problems"].items()):
+            print(f"FAIL {kind}: {count}")
+            for e in examples[:5]:
+                print(f"  {e}")
+        if not result["problems"]:
+            print("OK: no problems found")
+    return 1 if result["problems"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
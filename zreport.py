@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import argparse
+import datetime
+import threading
+
+import metrics
+from txstore import FileLock, encode
+from reports import empty_totals, add_receipt, open_entries
+
+# ==========================
+# END-OF-DAY CLOSE (Z-REPORTS)
+# ==========================
+# A close seals every receipt since the previous close and appends one
+# Z-report line to zreports.jsonl:
+#
+#   {"number": 7, "opened": <previous close>, "closed": <datetime>, "user": "admin",
+#    "checkpoint": <store.checkpoint()>, "count": .., "gross": .., "cash_collected": ..,
+#    "change_given": .., "card_total": .., "totals": <reports.empty_totals() shape>}
+#
+# A close covers receipts with opened < datetime <= closed, read through the
+# store's index (only that period's receipts are opened), and is taken
+# CLOSE_GRACE seconds in the past so a checkout still being written can't
+# fall between two reports. Sealed receipts can't be deleted from the
+# terminals (retention may still archive them), so a Z-report never goes
+# stale, and the sales report starts from the Z-reports and only reads the
+# receipts after the last close when it has to rebuild.
+#
+#   python zreport.py close | show [NUMBER] | list
+
+ZREPORT_FILE = "zreports.jsonl"
+LOCK_SUFFIX = ".lock"
+CLOSE_GRACE = 5     # seconds
+
+
+class ZReports:
+    def __init__(self, path=ZREPORT_FILE):
+        self.path = path
+        self.lock = threading.RLock()
+        self.file_lock = FileLock(path + LOCK_SUFFIX)
+        self.reports = []       # every close so far, oldest first
+        self.size = 0           # bytes of the file already read
+
+    def refresh(self):
+        with self.lock:
+            if not os.path.exists(self.path) or os.path.getsize(self.path) <= self.size:
+                return False
+            with open(self.path, "rb") as f:
+                f.seek(self.size)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    if line.strip():
+                        self.reports.append(json.loads(line))
+                    self.size += len(line)
+            return True
+
+    def all(self):
+        with self.lock:
+            self.refresh()
+            return list(self.reports)
+
+    def last(self):
+        with self.lock:
+            self.refresh()
+            return self.reports[-1] if self.reports else None
+
+    def sealed_through(self):
+        # receipts at or before this datetime are closed ("" before any close)
+        z = self.last()
+        return z["closed"] if z else ""
+
+    def get(self, number):
+        for z in self.all():
+            if z["number"] == number:
+                return z
+        return None
+
+    # ---------- closing ----------
+    def preview(self, store, until=None):
+        # the Z-report a close at `until` would write, without writing it
+        until = until or str(datetime.datetime.now() - datetime.timedelta(seconds=CLOSE_GRACE))
+        with store.lock, self.lock:
+            opened = self.sealed_through()
+            if until <= opened:
+                raise ValueError(f"Already closed through {opened}")
+            store.refresh()
+            checkpoint = store.checkpoint()
+            entries = [e for e in open_entries(store, opened) if e[2] <= until]
+            totals = empty_totals()
+            for rec in store.read_entries(entries):
+                add_receipt(totals, rec)
+            return {
+                "number": len(self.reports) + 1,
+                "opened": opened,
+                "closed": until,
+                "checkpoint": checkpoint,
+                "count": totals["count"],
+                "gross": totals["revenue"],
+                "cash_collected": totals["cash_collected"],
+                "change_given": totals["change_given"],
+                "card_total": totals["methods"].get("card", {}).get("total", 0),
+                "totals": totals
+            }
+
+    @metrics.timed("zreport.close")
+    def close(self, store, user=None, until=None):
+        # the store's lock always comes first: a rewrite notification holds it
+        # while the sales report reads the closes
+        with store.lock, self.lock, self.file_lock:
+            self.refresh()
+            z = self.preview(store, until)
+            z["user"] = user
+            z["closed_at"] = str(datetime.datetime.now())
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.size:
+                os.truncate(self.path, self.size)   # torn line from a crashed close
+            with open(self.path, "ab") as f:
+                data = encode(z)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self.reports.append(z)
+            self.size += len(data)
+            return z
+
+
+def lines(z, catalog=None):
+    out = [f"Z-report #{z['number']}",
+           f"Period: {z['opened'] or 'start'} .. {z['closed']}",
+           "",
+           f"Receipts: {z['count']}",
+           f"Gross: ₱{z['gross']}",
+           f"Cash collected: ₱{z['cash_collected']}  Change given: ₱{z['change_given']}"
+           f"  Net cash: ₱{z['cash_collected'] - z['change_given']}",
+           f"Card: ₱{z['card_total']}",
+           "",
+           "Products:"]
+    products = sorted(z["totals"]["products"].items(), key=lambda kv: kv[1]["qty"], reverse=True)
+    for key, p in products:
+        name = catalog.name_of(key) if catalog is not None and key in catalog.products else p.get("name", key)
+        out.append(f"  {name} x{p['qty']} = ₱{p['revenue']}")
+    if not products:
+        out.append("  (no sales)")
+    return out
+
+
+# ==========================
+# COMMAND LINE
+# ==========================
+def main(argv=None):
+    from storage import open_store
+
+    parser = argparse.ArgumentParser(description="End-of-day close and Z-reports")
+    parser.add_argument("command", choices=["close", "show", "list"])
+    parser.add_argument("number", nargs="?", type=int, help="Z-report to show (default: the last)")
+    parser.add_argument("--file", default=ZREPORT_FILE)
+    args = parser.parse_args(argv)
+
+    closes = ZReports(args.file)
+    if args.command == "list":
+        for z in closes.all():
+            print(f"#{z['number']:<5} {z['opened'] or 'start':<26} .. {z['closed']:<26} "
+                  f"{z['count']:>6} receipts  ₱{z['gross']}")
+        return 0
+    if args.command == "close":
+        store = open_store()
+        try:
+            z = closes.close(store, user="cli")
+        except ValueError as e:
+            print(e)
+            return 1
+        finally:
+            store.close()
+    else:
+        z = closes.get(args.number) if args.number else closes.last()
+        if z is None:
+            print("No such Z-report")
+            return 1
+    for line in lines(z):
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())